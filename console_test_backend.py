@@ -5,22 +5,34 @@ Enhanced AI agent with precise task execution, error recovery, and adaptive plan
 """
 
 import sys
+import io
 import json
 import time
 import asyncio
 import logging
+import logging.handlers
+import queue
+import atexit
 import os
+import signal
 import subprocess
 import re
+import threading
+import struct
+import hashlib
+import itertools
+import shutil
+import shlex
+import functools
 from pathlib import Path
 from typing import Dict, Any, Optional
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 if sys.platform == 'win32':
-    import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
@@ -30,12 +42,30 @@ try:
     GUI_AVAILABLE = False
     
     import mss
+    import mss.tools
+    from mss.screenshot import ScreenShot
+    if sys.platform == 'win32':
+        # Without CAPTUREBLT, BitBlt skips compositing layered windows, which
+        # makes GDI grabs noticeably cheaper
+        try:
+            import mss.windows.gdi as mss_windows
+        except ImportError:
+            import mss.windows as mss_windows
+        mss_windows.CAPTUREBLT = 0
     try:
-        import pyperclip
+        import orjson
+    except ImportError:
+        orjson = None
+    try:
+        from pydantic_core import from_json
     except ImportError:
-        pyperclip = None
+        from_json = None
     from PIL import Image
-    import google.generativeai as genai
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        cv2 = None
     
     try:
         import pyautogui
@@ -51,13 +81,24 @@ except ImportError as e:
 
 load_dotenv()
 
+# Handlers run on a listener thread; log calls on the hot path only enqueue
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - [CONTROL] - %(message)s')
+log_queue = queue.Queue(-1)
+# control.log is opened on the first flush and written in batches; errors
+# (and shutdown) flush right away
+log_file_handler = logging.FileHandler('control.log', delay=True)
+log_handlers = [logging.StreamHandler(sys.stdout), log_file_handler]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_handlers[1] = logging.handlers.MemoryHandler(256, flushLevel=logging.ERROR, target=log_file_handler)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - [CONTROL] - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('control.log')
-    ]
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(message)s',
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
@@ -107,9 +148,9 @@ SYSTEM_PROMPT = """You are Control, an intelligent AI assistant that can:
 3. double_click - Double click. params: {"coordinates": [x, y]}
 4. mouse_move - Move cursor. params: {"coordinates": [x, y]}
 5. scroll - Scroll wheel. params: {"coordinates": [x, y], "direction": "up|down", "amount": 3}
-6. type - Type text. params: {"text": "hello", "clear_first": false}
+6. type - Type text. params: {"text": "hello", "clear_first": false, "method": "auto"} - use method "keys" where pasting is blocked
 7. key_press - Keys/shortcuts. params: {"keys": ["ctrl", "a"], "combo": true}
-8. terminal - OS command. params: {"command": "command"}
+8. terminal - OS command. params: {"command": "command", "parallel": false} - set parallel true on consecutive commands that don't depend on each other to run them together
 9. wait - Pause. params: {"duration": 1}
 10. focus_window - Switch to app window. params: {"app_name": "Chrome", "method": "alt_tab|search"}
 
@@ -118,20 +159,359 @@ SYSTEM_PROMPT = """You are Control, an intelligent AI assistant that can:
 - For questions: Provide natural, helpful response
 - For tasks: Use terminal for system operations, UI interaction for applications
 - System tasks: Use terminal commands (fastest, most reliable)
-- App interactions: ALWAYS screenshot first to see current state
+- The current screen is attached to every request - plan from it directly, do not start with a screenshot action
 - Before app interaction: Check window focus, switch if needed using focus_window action
 - ALWAYS click text fields before typing
 - Use keyboard shortcuts for efficiency
 - If action fails: Try alternative method
 - Speed and precision are both important"""
 
+# Settle time after each action before the next one runs. Terminal commands
+# and waits have already finished when they return; GUI input needs a moment
+# for the target app to react
+ACTION_SETTLE_DELAY = {
+    'screenshot': 0,
+    'terminal': 0,
+    'wait': 0,
+    'mouse_move': 0.02,
+    'type': 0.05,
+    'click': 0.1,
+    'double_click': 0.1,
+    'scroll': 0.1,
+    'key_press': 0.1,
+    'focus_window': 0.3,
+}
+DEFAULT_SETTLE_DELAY = 0.2
+
+# Long edge of screenshots sent to the LLM
+MAX_UPLOAD_EDGE = 1568
+# Seconds a cached LLM reply stays valid; the screen can look the same
+# while the answer ("what time is it", "any new mail?") has moved on
+LLM_CACHE_TTL = 300.0
+# Frames a single record burst may hold in memory
+MAX_STREAM_FRAMES = 120
+
+# Commands that need a shell: builtins, and anything using shell syntax
+SHELL_BUILTINS = {
+    'cd', 'chdir', 'dir', 'echo', 'set', 'export', 'source', 'alias', 'type', 'copy', 'move',
+    'del', 'erase', 'ren', 'rename', 'md', 'mkdir', 'rd', 'rmdir', 'start', 'call', 'cls',
+    'pushd', 'popd', 'exit', 'mklink', 'assoc', 'ftype', 'title', 'ver', 'vol',
+}
+SHELL_METACHARS = frozenset('|&;<>()$`*?~%^!\n')
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+@functools.lru_cache(maxsize=128)
+def resolve_executable(name: str) -> Optional[str]:
+    return shutil.which(name)
+
+def split_command(command: str) -> Optional[list]:
+    # argv for running without a shell, or None when a shell is required
+    if not command or SHELL_METACHARS.intersection(command):
+        return None
+    try:
+        argv = shlex.split(command, posix=(os.name != 'nt'))
+    except ValueError:
+        return None
+    if os.name == 'nt':
+        argv = [arg[1:-1] if len(arg) > 1 and arg[0] == arg[-1] == '"' else arg for arg in argv]
+    if not argv or argv[0].lower() in SHELL_BUILTINS:
+        return None
+    executable = resolve_executable(argv[0])
+    if executable is None:
+        return None
+    return [executable] + argv[1:]
+
+async def kill_process(proc) -> None:
+    # On POSIX commands run in their own session, so the whole group goes:
+    # a shell's children hold the output pipes too, and wait() only returns
+    # once those close. Elsewhere only the direct child can be killed, so
+    # the wait for it is bounded
+    if os.name != 'nt':
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        proc.kill()
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=1)
+    except asyncio.TimeoutError:
+        pass
+
+def is_parallel_terminal(action: Dict[str, Any]) -> bool:
+    return (str(action.get('action', '')).lower() == 'terminal'
+            and bool((action.get('parameters') or {}).get('parallel')))
+
+def fuse_actions(actions: list) -> list:
+    # Typing followed by Enter, or back-to-back typing, becomes a single
+    # 'type' action so the whole keystroke sequence goes out in one batch.
+    # pyautogui.write and the SendInput path both send '\n' as Enter
+    fused = []
+    for action in actions:
+        prev = fused[-1] if fused else None
+        params = action.get('parameters') or {}
+        if prev is not None and str(prev.get('action', '')).lower() == 'type':
+            action_type = str(action.get('action', '')).lower()
+            keys = [str(k).lower() for k in params.get('keys', [])]
+            if action_type == 'key_press' and keys in (['enter'], ['return']):
+                suffix = '\n'
+            elif action_type == 'type' and not params.get('clear_first'):
+                suffix = str(params.get('text', ''))
+            else:
+                suffix = None
+            if suffix is not None:
+                prev_params = dict(prev.get('parameters') or {})
+                prev_params['text'] = str(prev_params.get('text', '')) + suffix
+                fused[-1] = dict(prev, parameters=prev_params)
+                descriptions = [d for d in (prev.get('description'), action.get('description')) if d]
+                if descriptions:
+                    fused[-1]['description'] = '; '.join(descriptions)
+                continue
+        fused.append(action)
+    return fused
+
+@functools.cache
+def get_pyperclip():
+    # Imported on first use: pyperclip probes for clipboard backends at import
+    try:
+        import pyperclip
+        return pyperclip
+    except ImportError:
+        return None
+
+JSON_FENCE_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+
+def extract_json(response_text: str) -> str:
+    if '```json' in response_text:
+        fence = JSON_FENCE_RE.search(response_text)
+        if fence:
+            return fence.group(1)
+    # First '{' to last '}' - what a greedy DOTALL r'\{.*\}' matches, without
+    # the regex scan
+    start = response_text.find('{')
+    end = response_text.rfind('}')
+    if start >= 0 and end > start:
+        return response_text[start:end + 1]
+    if start >= 0 and from_json is not None:
+        # Truncated reply; parse_llm_json can still recover the prefix
+        return response_text[start:]
+    raise ValueError("No JSON found")
+
+def parse_llm_json(json_str: str) -> Dict[str, Any]:
+    # Well-formed replies take orjson's strict fast path; pydantic_core then
+    # tolerates an answer cut off at the token limit instead of failing the
+    # whole turn
+    if orjson is not None:
+        try:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            if from_json is None:
+                raise
+    elif from_json is None:
+        return json.loads(json_str)
+    else:
+        try:
+            return from_json(json_str)
+        except ValueError:
+            pass
+    partial = from_json(json_str, allow_partial='trailing-strings')
+    # A truncated task plan can end in an action that lost its parameters;
+    # that has to fail and be retried rather than run
+    if not isinstance(partial, dict) or partial.get('type') != 'question':
+        raise ValueError("Reply was cut off before its JSON was complete")
+    return partial
+
+def dump_json(obj: Any, indent: bool = False) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, indent=2 if indent else None)
+
+def image_dhash(image_bytes: bytes) -> int:
+    # 64-bit difference hash: brightness gradients of a 9x8 grayscale
+    # thumbnail. draft() lets the JPEG decoder produce it at 1/8 scale
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft('L', (72, 64))
+    pixels = list(img.convert('L').resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits
+
+def write_bmp(filepath: str, bgra: bytes, size) -> None:
+    # Uncompressed 32-bit top-down BMP: the mss BGRA buffer is already in
+    # BMP pixel order, so the whole file is a header plus one memcpy.
+    width, height = size
+    file_header = struct.pack('<2sIHHI', b'BM', 54 + len(bgra), 0, 0, 54)
+    info_header = struct.pack('<IiiHHIIiiII', 40, width, -height, 1, 32, 0,
+                              len(bgra), 2835, 2835, 0, 0)
+    with open(filepath, 'wb') as f:
+        f.write(file_header + info_header)
+        f.write(bgra)
+
+if sys.platform == 'win32':
+    # SendInput talks to the input queue directly, skipping pyautogui's
+    # per-call sleeps and its one-event-per-call mouse_event/keybd_event path
+    import ctypes
+    from ctypes import wintypes
+    
+    INPUT_MOUSE = 0
+    INPUT_KEYBOARD = 1
+    MOUSEEVENTF_MOVE = 0x0001
+    MOUSEEVENTF_LEFTDOWN = 0x0002
+    MOUSEEVENTF_LEFTUP = 0x0004
+    MOUSEEVENTF_WHEEL = 0x0800
+    MOUSEEVENTF_VIRTUALDESK = 0x4000
+    MOUSEEVENTF_ABSOLUTE = 0x8000
+    KEYEVENTF_KEYUP = 0x0002
+    KEYEVENTF_UNICODE = 0x0004
+    VK_RETURN = 0x0D
+    WHEEL_DELTA = 120
+    SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN = 76, 77, 78, 79
+    
+    class MOUSEINPUT(ctypes.Structure):
+        _fields_ = [('dx', wintypes.LONG), ('dy', wintypes.LONG), ('mouseData', wintypes.DWORD),
+                    ('dwFlags', wintypes.DWORD), ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+    
+    class KEYBDINPUT(ctypes.Structure):
+        _fields_ = [('wVk', wintypes.WORD), ('wScan', wintypes.WORD), ('dwFlags', wintypes.DWORD),
+                    ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+    
+    class HARDWAREINPUT(ctypes.Structure):
+        _fields_ = [('uMsg', wintypes.DWORD), ('wParamL', wintypes.WORD), ('wParamH', wintypes.WORD)]
+    
+    class _INPUTUNION(ctypes.Union):
+        _fields_ = [('mi', MOUSEINPUT), ('ki', KEYBDINPUT), ('hi', HARDWAREINPUT)]
+    
+    class INPUT(ctypes.Structure):
+        _anonymous_ = ('u',)
+        _fields_ = [('type', wintypes.DWORD), ('u', _INPUTUNION)]
+    
+    user32 = ctypes.WinDLL('user32', use_last_error=True)
+    user32.SendInput.argtypes = (wintypes.UINT, ctypes.POINTER(INPUT), ctypes.c_int)
+    user32.SendInput.restype = wintypes.UINT
+    
+    def send_inputs(events: list) -> None:
+        # One call for the whole sequence, so it can't be interleaved with
+        # real user input
+        arr = (INPUT * len(events))(*events)
+        if user32.SendInput(len(events), arr, ctypes.sizeof(INPUT)) != len(events):
+            raise ctypes.WinError(ctypes.get_last_error())
+    
+    def win_mouse_input(flags: int, dx: int = 0, dy: int = 0, data: int = 0):
+        return INPUT(type=INPUT_MOUSE, mi=MOUSEINPUT(dx, dy, data & 0xFFFFFFFF, flags, 0, 0))
+    
+    def win_move_input(x: int, y: int):
+        # Absolute coordinates are normalized to 0..65535 across the virtual desktop
+        left = user32.GetSystemMetrics(SM_XVIRTUALSCREEN)
+        top = user32.GetSystemMetrics(SM_YVIRTUALSCREEN)
+        width = max(user32.GetSystemMetrics(SM_CXVIRTUALSCREEN) - 1, 1)
+        height = max(user32.GetSystemMetrics(SM_CYVIRTUALSCREEN) - 1, 1)
+        return win_mouse_input(MOUSEEVENTF_MOVE | MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK,
+                               (x - left) * 65535 // width, (y - top) * 65535 // height)
+    
+    def win_text_inputs(text: str) -> list:
+        events = []
+        utf16 = text.replace('\r\n', '\n').encode('utf-16-le')
+        for i in range(0, len(utf16), 2):
+            unit = int.from_bytes(utf16[i:i + 2], 'little')
+            if unit == 0x0A:
+                down = KEYBDINPUT(VK_RETURN, 0, 0, 0, 0)
+                up = KEYBDINPUT(VK_RETURN, 0, KEYEVENTF_KEYUP, 0, 0)
+            else:
+                down = KEYBDINPUT(0, unit, KEYEVENTF_UNICODE, 0, 0)
+                up = KEYBDINPUT(0, unit, KEYEVENTF_UNICODE | KEYEVENTF_KEYUP, 0, 0)
+            events.append(INPUT(type=INPUT_KEYBOARD, ki=down))
+            events.append(INPUT(type=INPUT_KEYBOARD, ki=up))
+        return events
+
+class ActionStream:
+    # The steps of a task plan as they arrive in a streamed reply. Steps are
+    # fused on arrival, so only the last one can still change
+    
+    def __init__(self):
+        self.plan = {}
+        self.actions = []
+        self.received = 0
+        self.done = False
+        self._changed = asyncio.Event()
+    
+    def add(self, actions: list) -> None:
+        # Partial replies repeat the steps already seen; only take new ones
+        for action in actions[self.received:]:
+            if isinstance(action, dict):
+                self.actions[-1:] = fuse_actions(self.actions[-1:] + [action])
+        self.received = max(self.received, len(actions))
+        self._changed.set()
+    
+    def finish(self, actions: list, plan: Optional[Dict[str, Any]] = None) -> None:
+        # One-step plans and cache hits never stream a partial plan
+        if not self.plan and plan:
+            self.plan = plan
+        self.add(actions)
+        self.done = True
+        self._changed.set()
+    
+    async def wait_for(self, count: int) -> bool:
+        # True once there are at least count steps, False if the reply ended first
+        while len(self.actions) < count and not self.done:
+            self._changed.clear()
+            await self._changed.wait()
+        return len(self.actions) >= count
+
+def requires_gui(handler):
+    @functools.wraps(handler)
+    def wrapper(self, params, result):
+        if not (GUI_AVAILABLE and pyautogui):
+            result["message"] = "GUI control not available"
+            return
+        handler(self, params, result)
+    return wrapper
+
 class ConsoleTestBackend:
     
     def __init__(self):
         self.running = True
         self.screenshot_dir = project_root / "screenshots"
-        self.screenshot_dir.mkdir(exist_ok=True)
+        self._screenshot_dir_ready = False
         self.execution_history = []
+        # GEMINI_TIMEOUT is in milliseconds, matching .env.example
+        self.request_timeout = float(os.getenv('GEMINI_TIMEOUT', '15000')) / 1000
+        self.llm_max_retries = 3
+        self._sct = None
+        self._monitor = None
+        self._dxcam = None
+        self._last_frame = None
+        self._sct_lock = threading.Lock()
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shot-io')
+        self.screenshot_format = os.getenv('SCREENSHOT_FORMAT', 'png').lower()
+        self.save_screenshots = '--save-screenshots' in sys.argv[1:]
+        # One timestamp per session plus a counter keeps names unique without
+        # a strftime call per capture
+        session = time.strftime("%Y%m%d_%H%M%S")
+        self._shot_prefix = f"{self.screenshot_dir}{os.sep}screenshot_{session}_"
+        self._shot_counter = itertools.count(1)
+        self._native_screenshot = None
+        if os.getenv('NATIVE_SCREENSHOT') == '1':
+            self._native_screenshot = self._find_native_screenshot_tool()
+        self.upload_scale = 1.0
+        self._dispatch = {
+            'screenshot': self._act_screenshot,
+            'click': self._act_click,
+            'double_click': self._act_double_click,
+            'mouse_move': self._act_mouse_move,
+            'scroll': self._act_scroll,
+            'type': self._act_type,
+            'key_press': self._act_key_press,
+            'terminal': self._act_terminal,
+            'wait': self._act_wait,
+            'focus_window': self._act_focus_window,
+        }
+        self._answer_streamed = False
+        self._llm_cache = OrderedDict()
+        self.llm_cache_size = 64
+        self._warm_up_task = None
         
         self.setup_gemini_api()
         self.setup_computer_control()
@@ -144,51 +524,249 @@ class ConsoleTestBackend:
             api_key = "test_api_key"
             logger.warning("No API key found")
         
+        # google.generativeai and the model are loaded on first request, so
+        # 'screenshot'/'help'/'quit' sessions never pay for them
+        self.api_key = api_key
+        print("[API] Ready\n")
+    
+    @functools.cached_property
+    def model(self):
         try:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash', 
-                                             system_instruction=SYSTEM_PROMPT)
-            print("[API] Ready\n")
+            import google.generativeai as genai
+            # The SDK caches one client (and its gRPC channel) per service until
+            # configure() runs again, so configure exactly once. Leave transport
+            # at its default: forcing "grpc" hands generate_content_async a
+            # synchronous channel.
+            genai.configure(api_key=self.api_key)
+            model = genai.GenerativeModel('gemini-2.0-flash', 
+                                          system_instruction=SYSTEM_PROMPT)
             logger.info("API configured")
+            return model
         except Exception as e:
             print(f"[API] ERROR: {e}\n")
-            self.model = None
+            return None
     
     def setup_computer_control(self):
         try:
             if GUI_AVAILABLE and pyautogui:
                 pyautogui.FAILSAFE = True
-                pyautogui.PAUSE = 0.05
+                # Steps are paced by the task loop; a per-call pause only adds
+                # dead time to every click and keystroke
+                pyautogui.PAUSE = 0
                 print("[CONTROL] GUI libraries ready\n")
             
             try:
-                with mss.mss() as sct:
-                    monitors = sct.monitors
-                    print(f"[CONTROL] {len(monitors)-1} monitor(s) detected\n")
+                self._sct = mss.mss()
+                monitors = self._sct.monitors
+                self._monitor = monitors[1]
+                print(f"[CONTROL] {len(monitors)-1} monitor(s) detected\n")
             except Exception as e:
                 print(f"[CONTROL] WARNING: {e}\n")
+            
+            # DXGI Desktop Duplication is much faster than GDI BitBlt on
+            # Windows; elsewhere mss already uses the native API (XShm on
+            # Linux, CoreGraphics on macOS)
+            if sys.platform == 'win32':
+                try:
+                    import dxcam
+                    self._dxcam = dxcam.create(output_color="BGRA")
+                    print("[CONTROL] DXcam capture enabled\n")
+                except Exception as e:
+                    logger.info(f"DXcam unavailable, using mss: {e}")
         except Exception as e:
             print(f"[CONTROL] ERROR: {e}\n")
     
+    def close(self) -> None:
+        # Let pending screenshot writes finish
+        self._io_pool.shutdown(wait=True)
+        with self._sct_lock:
+            if self._dxcam is not None:
+                self._dxcam.release()
+                self._dxcam = None
+            if self._sct is not None:
+                self._sct.close()
+                self._sct = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _grab_dxcam(self):
+        frame = self._dxcam.grab()
+        # grab() returns None when nothing changed since the last frame
+        if frame is not None:
+            height, width = frame.shape[:2]
+            left, top = (self._monitor['left'], self._monitor['top']) if self._monitor else (0, 0)
+            region = {'left': left, 'top': top, 'width': width, 'height': height}
+            self._last_frame = ScreenShot(bytearray(frame.tobytes()), region)
+        return self._last_frame
+    
+    def grab_screen(self):
+        with self._sct_lock:
+            if self._dxcam is not None:
+                sct_img = self._grab_dxcam()
+                if sct_img is not None:
+                    return sct_img
+            if self._sct is None:
+                raise RuntimeError("Screen capture not available")
+            return self._sct.grab(self._monitor)
+    
+    def _next_screenshot_path(self, ext: str) -> str:
+        # Created on the first file write, once per session; uploads alone
+        # never touch the disk
+        if not self._screenshot_dir_ready:
+            self.screenshot_dir.mkdir(exist_ok=True)
+            self._screenshot_dir_ready = True
+        return f"{self._shot_prefix}{next(self._shot_counter):04d}.{ext}"
+    
+    def take_screenshot_bytes(self) -> bytes:
+        # In-memory JPEG for the LLM: several times faster to encode than PNG
+        # and a fraction of the upload. Only hits disk with --save-screenshots
+        try:
+            sct_img = self.grab_screen()
+            # Gemini downsamples large images anyway; sending at most
+            # MAX_UPLOAD_EDGE px cuts upload size. Model coordinates are mapped
+            # back to screen pixels with upload_scale
+            width, height = sct_img.size
+            self.upload_scale = min(1.0, MAX_UPLOAD_EDGE / max(width, height))
+            size = (round(width * self.upload_scale), round(height * self.upload_scale))
+            if cv2 is not None:
+                # BGRA is OpenCV's native channel order, so dropping alpha is
+                # just a view over the mss buffer
+                frame = np.frombuffer(sct_img.bgra, dtype=np.uint8).reshape(height, width, 4)[..., :3]
+                if self.upload_scale < 1:
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+                ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                if not ok:
+                    raise RuntimeError("JPEG encoding failed")
+                image_bytes = buf.tobytes()
+            else:
+                # frombuffer reads the BGRA frame in place instead of going
+                # through the repacked .rgb copy
+                img = Image.frombuffer("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX", 0, 1)
+                if self.upload_scale < 1:
+                    img = img.resize(size, Image.Resampling.BILINEAR)
+                buf = io.BytesIO()
+                img.save(buf, format="JPEG", quality=85, optimize=False, subsampling=2)
+                image_bytes = buf.getvalue()
+            
+            if self.save_screenshots:
+                filepath = Path(self._next_screenshot_path('jpg'))
+                self._io_pool.submit(self._write_screenshot, filepath, lambda: filepath.write_bytes(image_bytes))
+            return image_bytes
+        
+        except Exception as e:
+            logger.error(f"Screenshot error: {e}")
+            return b""
+    
+    def _find_native_screenshot_tool(self) -> Optional[list]:
+        # Resolved once so take_screenshot doesn't search PATH per capture
+        if sys.platform == 'darwin':
+            candidates = [['screencapture', '-x']]
+        elif sys.platform == 'win32':
+            candidates = [['nircmd.exe', 'savescreenshot']]
+        else:
+            candidates = [['grim'], ['scrot', '-o']]
+        
+        for cmd in candidates:
+            exe = shutil.which(cmd[0])
+            if exe:
+                logger.info(f"Native screenshots via {cmd[0]}")
+                return [exe] + cmd[1:]
+        print("[CONTROL] WARNING: NATIVE_SCREENSHOT set but no capture tool found, using mss\n")
+        return None
+    
+    def _write_screenshot(self, filepath, write) -> None:
+        try:
+            write()
+            logger.info("Screenshot saved: %s", filepath)
+        except Exception as e:
+            logger.error(f"Screenshot write error: {e}")
+    
     def take_screenshot(self) -> str:
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"screenshot_{timestamp}.png"
-            filepath = self.screenshot_dir / filename
+            if self._native_screenshot:
+                # grim and screencapture write PNG whatever the extension says
+                filepath = self._next_screenshot_path('png')
+                subprocess.run(self._native_screenshot + [filepath], check=True, timeout=10)
+                logger.info("Screenshot saved: %s", filepath)
+                return filepath
             
-            with mss.mss() as sct:
-                monitor = sct.monitors[1]
-                sct_img = sct.grab(monitor)
-                img = Image.frombytes("RGB", sct_img.size, sct_img.rgb)
-                img.save(filepath)
+            ext = 'bmp' if self.screenshot_format == 'bmp' else 'png'
+            filepath = self._next_screenshot_path(ext)
             
-            logger.info(f"Screenshot saved: {filepath}")
-            return str(filepath)
+            # Encoding and the disk write happen on the I/O thread; callers
+            # only need the path
+            sct_img = self.grab_screen()
+            if ext == 'bmp':
+                self._io_pool.submit(self._write_screenshot, filepath,
+                                     lambda: write_bmp(filepath, sct_img.bgra, sct_img.size))
+            else:
+                self._io_pool.submit(self._write_screenshot, filepath,
+                                     lambda: mss.tools.to_png(sct_img.rgb, sct_img.size, output=filepath))
+            return filepath
         
         except Exception as e:
             logger.error(f"Screenshot error: {e}")
             return ""
     
+    def capture_stream(self, n_frames: int) -> list:
+        # Burst capture: frames are grabbed back-to-back and written straight
+        # from each grab's raw buffer, with BMP writes overlapped on worker
+        # threads
+        n_frames = max(1, min(n_frames, MAX_STREAM_FRAMES))
+        paths = []
+        
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='shot-io') as pool:
+            for _ in range(n_frames):
+                sct_img = self.grab_screen()
+                filepath = self._next_screenshot_path('bmp')
+                pool.submit(write_bmp, filepath, sct_img.raw, sct_img.size)
+                paths.append(filepath)
+        
+        logger.info("Captured %d frames", n_frames)
+        return paths
+    
+    def _to_screen(self, coordinates) -> tuple:
+        # The model sees the downscaled upload, so its coordinates are in
+        # that image's pixels
+        x, y = coordinates
+        return round(x / self.upload_scale), round(y / self.upload_scale)
+    
+    def _send_click(self, x: int, y: int, clicks: int = 1) -> None:
+        if sys.platform == 'win32':
+            events = [win_move_input(x, y)]
+            for _ in range(clicks):
+                events.append(win_mouse_input(MOUSEEVENTF_LEFTDOWN))
+                events.append(win_mouse_input(MOUSEEVENTF_LEFTUP))
+            send_inputs(events)
+        else:
+            pyautogui.click(x, y, clicks=clicks)
+    
+    def _send_move(self, x: int, y: int) -> None:
+        if sys.platform == 'win32':
+            send_inputs([win_move_input(x, y)])
+        else:
+            pyautogui.moveTo(x, y)
+    
+    def _send_scroll(self, x: int, y: int, clicks: int) -> None:
+        # Positive clicks scroll up, as with pyautogui.scroll
+        if sys.platform == 'win32':
+            send_inputs([win_move_input(x, y),
+                         win_mouse_input(MOUSEEVENTF_WHEEL, data=clicks * WHEEL_DELTA)])
+        else:
+            pyautogui.moveTo(x, y)
+            pyautogui.scroll(clicks)
+    
+    def _send_text(self, text: str) -> None:
+        if sys.platform == 'win32':
+            if text:
+                send_inputs(win_text_inputs(text))
+        else:
+            pyautogui.write(text)
+    
     def execute_action(self, action: Dict[str, Any]) -> Dict[str, Any]:
         result = {"success": False, "message": "", "action": action.get('action')}
         
@@ -196,112 +774,9 @@ class ConsoleTestBackend:
             action_type = action.get('action', '').lower()
             params = action.get('parameters', {})
             
-            if action_type == 'screenshot':
-                filepath = self.take_screenshot()
-                result["success"] = bool(filepath)
-                result["message"] = filepath
-                print(f"[SCREENSHOT] Captured\n")
-            
-            elif action_type == 'click':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.click(x, y)
-                    result["success"] = True
-                    result["message"] = f"Clicked ({x}, {y})"
-                    print(f"[CLICK] ({x}, {y})\n")
-            
-            elif action_type == 'double_click':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.click(x, y, clicks=2)
-                    result["success"] = True
-                    result["message"] = f"Double-clicked ({x}, {y})"
-                    print(f"[DOUBLE_CLICK] ({x}, {y})\n")
-            
-            elif action_type == 'mouse_move':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.moveTo(x, y)
-                    result["success"] = True
-                    result["message"] = f"Moved to ({x}, {y})"
-                    print(f"[MOUSE_MOVE] ({x}, {y})\n")
-            
-            elif action_type == 'scroll':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [500, 500])
-                    direction = params.get('direction', 'down')
-                    amount = params.get('amount', 3)
-                    scroll_amount = amount if direction == 'down' else -amount
-                    pyautogui.moveTo(x, y)
-                    pyautogui.scroll(scroll_amount)
-                    result["success"] = True
-                    result["message"] = f"Scrolled {direction} by {amount}"
-                    print(f"[SCROLL] {direction} x{amount}\n")
-            
-            elif action_type == 'type':
-                if GUI_AVAILABLE and pyautogui:
-                    text = params.get('text', '')
-                    clear_first = params.get('clear_first', False)
-                    if clear_first:
-                        pyautogui.hotkey('ctrl', 'a')
-                        time.sleep(0.1)
-                    pyautogui.write(text)
-                    result["success"] = True
-                    result["message"] = f"Typed: {text[:30]}"
-                    print(f"[TYPE] {text[:30]}\n")
-            
-            elif action_type == 'key_press':
-                if GUI_AVAILABLE and pyautogui:
-                    keys = params.get('keys', [])
-                    combo = params.get('combo', len(keys) > 1)
-                    if combo and len(keys) > 1:
-                        pyautogui.hotkey(*keys)
-                    else:
-                        for key in keys:
-                            pyautogui.press(key)
-                    result["success"] = True
-                    result["message"] = f"Keys: {'+'.join(keys)}"
-                    print(f"[KEY_PRESS] {'+'.join(keys)}\n")
-            
-            elif action_type == 'terminal':
-                command = params.get('command', '')
-                try:
-                    output = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=10)
-                    result["success"] = output.returncode == 0
-                    result["message"] = output.stdout[:200] if output.stdout else output.stderr[:200]
-                    print(f"[TERMINAL] {command}\n")
-                except Exception as e:
-                    result["message"] = str(e)
-            
-            elif action_type == 'wait':
-                duration = params.get('duration', 1)
-                time.sleep(duration)
-                result["success"] = True
-                result["message"] = f"Waited {duration}s"
-                print(f"[WAIT] {duration}s\n")
-            
-            elif action_type == 'focus_window':
-                if GUI_AVAILABLE and pyautogui:
-                    app_name = params.get('app_name', '')
-                    method = params.get('method', 'alt_tab')
-                    
-                    if method == 'alt_tab':
-                        pyautogui.hotkey('alt', 'tab')
-                        result["success"] = True
-                        result["message"] = f"Alt+Tab to switch window"
-                        print(f"[FOCUS_WINDOW] Alt+Tab\n")
-                    elif method == 'search':
-                        pyautogui.hotkey('win')
-                        time.sleep(0.3)
-                        pyautogui.write(app_name)
-                        time.sleep(0.5)
-                        pyautogui.press('enter')
-                        result["success"] = True
-                        result["message"] = f"Opened/focused {app_name}"
-                        print(f"[FOCUS_WINDOW] Searching for {app_name}\n")
-                    else:
-                        result["message"] = f"Unknown focus method: {method}"
-            
+            handler = self._dispatch.get(action_type)
+            if handler:
+                handler(params, result)
             else:
                 result["message"] = f"Unknown action: {action_type}"
         
@@ -312,7 +787,239 @@ class ConsoleTestBackend:
         
         return result
     
-    def send_to_llm(self, prompt: str, screenshot_path: str = None, retry_info: str = None) -> Dict[str, Any]:
+    def _act_screenshot(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        filepath = self.take_screenshot()
+        result["success"] = bool(filepath)
+        result["message"] = filepath
+        print(f"[SCREENSHOT] Captured\n")
+    
+    @requires_gui
+    def _act_click(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        self._send_click(x, y)
+        result["success"] = True
+        result["message"] = f"Clicked ({x}, {y})"
+        print(f"[CLICK] ({x}, {y})\n")
+    
+    @requires_gui
+    def _act_double_click(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        self._send_click(x, y, clicks=2)
+        result["success"] = True
+        result["message"] = f"Double-clicked ({x}, {y})"
+        print(f"[DOUBLE_CLICK] ({x}, {y})\n")
+    
+    @requires_gui
+    def _act_mouse_move(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        self._send_move(x, y)
+        result["success"] = True
+        result["message"] = f"Moved to ({x}, {y})"
+        print(f"[MOUSE_MOVE] ({x}, {y})\n")
+    
+    @requires_gui
+    def _act_scroll(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [500, 500]))
+        direction = params.get('direction', 'down')
+        amount = params.get('amount', 3)
+        scroll_amount = -amount if direction == 'down' else amount
+        self._send_scroll(x, y, scroll_amount)
+        result["success"] = True
+        result["message"] = f"Scrolled {direction} by {amount}"
+        print(f"[SCROLL] {direction} x{amount}\n")
+    
+    @requires_gui
+    def _act_type(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        text = params.get('text', '')
+        clear_first = params.get('clear_first', False)
+        method = params.get('method', 'auto')
+        if clear_first:
+            pyautogui.hotkey('ctrl', 'a')
+            time.sleep(0.1)
+        
+        pyperclip = get_pyperclip()
+        if pyperclip is not None and (method == 'paste' or (method == 'auto' and len(text) > 10)):
+            # One paste instead of a key event pair per character. A trailing
+            # newline (e.g. a fused Enter) is pressed rather than pasted so it
+            # still submits single-line fields
+            body = text.rstrip('\n')
+            if body:
+                pyperclip.copy(body)
+                pyautogui.hotkey('command' if sys.platform == 'darwin' else 'ctrl', 'v')
+            for _ in range(len(text) - len(body)):
+                pyautogui.press('enter')
+        else:
+            self._send_text(text)
+        result["success"] = True
+        result["message"] = f"Typed: {text[:30]}"
+        print(f"[TYPE] {text[:30]}\n")
+    
+    @requires_gui
+    def _act_key_press(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        keys = params.get('keys', [])
+        combo = params.get('combo', len(keys) > 1)
+        if combo and len(keys) > 1:
+            pyautogui.hotkey(*keys)
+        else:
+            for key in keys:
+                pyautogui.press(key)
+        result["success"] = True
+        result["message"] = f"Keys: {'+'.join(keys)}"
+        print(f"[KEY_PRESS] {'+'.join(keys)}\n")
+    
+    def _act_terminal(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        command = params.get('command', '')
+        try:
+            argv = split_command(command)
+            output = subprocess.run(command if argv is None else argv, shell=argv is None,
+                                    capture_output=True, text=True, timeout=10,
+                                    creationflags=CREATE_NO_WINDOW)
+            result["success"] = output.returncode == 0
+            result["message"] = output.stdout[:200] if output.stdout else output.stderr[:200]
+            print(f"[TERMINAL] {command}\n")
+        except Exception as e:
+            result["message"] = str(e)
+    
+    def _act_wait(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        duration = params.get('duration', 1)
+        time.sleep(duration)
+        result["success"] = True
+        result["message"] = f"Waited {duration}s"
+        print(f"[WAIT] {duration}s\n")
+    
+    @requires_gui
+    def _act_focus_window(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        app_name = params.get('app_name', '')
+        method = params.get('method', 'alt_tab')
+        
+        if method == 'alt_tab':
+            pyautogui.hotkey('alt', 'tab')
+            result["success"] = True
+            result["message"] = f"Alt+Tab to switch window"
+            print(f"[FOCUS_WINDOW] Alt+Tab\n")
+        elif method == 'search':
+            pyautogui.hotkey('win')
+            time.sleep(0.3)
+            pyautogui.write(app_name)
+            time.sleep(0.5)
+            pyautogui.press('enter')
+            result["success"] = True
+            result["message"] = f"Opened/focused {app_name}"
+            print(f"[FOCUS_WINDOW] Searching for {app_name}\n")
+        else:
+            result["message"] = f"Unknown focus method: {method}"
+    
+    async def run_terminal(self, action: Dict[str, Any]) -> Dict[str, Any]:
+        # Runs on the event loop instead of blocking it for up to the timeout
+        result = {"success": False, "message": "", "action": action.get('action')}
+        command = (action.get('parameters') or {}).get('command', '')
+        try:
+            # Plain "program args" commands skip the extra shell process
+            argv = split_command(command)
+            if argv is None:
+                proc = await asyncio.create_subprocess_shell(
+                    command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    creationflags=CREATE_NO_WINDOW, start_new_session=(os.name != 'nt'))
+            else:
+                proc = await asyncio.create_subprocess_exec(
+                    *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    creationflags=CREATE_NO_WINDOW, start_new_session=(os.name != 'nt'))
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=10)
+            except asyncio.TimeoutError:
+                await kill_process(proc)
+                raise TimeoutError(f"Command '{command}' timed out after 10 seconds")
+            stdout = stdout.decode(errors='replace')
+            stderr = stderr.decode(errors='replace')
+            result["success"] = proc.returncode == 0
+            result["message"] = stdout[:200] if stdout else stderr[:200]
+            print(f"[TERMINAL] {command}\n")
+        except Exception as e:
+            result["message"] = str(e)
+        return result
+    
+    async def _dispatch_action(self, action: Dict[str, Any]) -> Dict[str, Any]:
+        action_type = str(action.get('action', '')).lower()
+        if action_type == 'terminal':
+            return await self.run_terminal(action)
+        if action_type == 'screenshot':
+            return self.execute_action(action)
+        # Input injection and waits run off the event loop, so they don't
+        # count against the timeout of a plan that is still streaming
+        return await asyncio.to_thread(self.execute_action, action)
+    
+    def _parse_partial(self, response_text: str) -> Optional[Dict[str, Any]]:
+        start = response_text.find('{')
+        if from_json is None or start < 0:
+            return None
+        try:
+            partial = from_json(response_text[start:], allow_partial='trailing-strings')
+        except (ValueError, TypeError):
+            return None
+        return partial if isinstance(partial, dict) else None
+    
+    def _preview_answer(self, partial: Dict[str, Any], shown: int) -> int:
+        # Echo a question's answer while it streams in
+        if partial.get('type') != 'question':
+            return shown
+        answer = partial.get('response')
+        if isinstance(answer, str) and len(answer) > shown:
+            if shown == 0:
+                print("[ANSWER]")
+            print(answer[shown:], end='', flush=True)
+            return len(answer)
+        return shown
+    
+    def _stream_actions(self, partial: Dict[str, Any], action_stream: 'ActionStream') -> None:
+        # Every action but the last one seen is complete
+        actions = partial.get('actions')
+        if partial.get('type') != 'task' or not isinstance(actions, list) or len(actions) < 2:
+            return
+        if not action_stream.plan:
+            action_stream.plan = {k: partial.get(k, '') for k in ('analysis', 'plan')}
+        action_stream.add(actions[:-1])
+    
+    async def _stream_response(self, content_parts, stream_answer: bool,
+                               action_stream: Optional['ActionStream'] = None) -> str:
+        response = await self.model.generate_content_async(content_parts, stream=True)
+        response_text = ""
+        shown = 0
+        async for chunk in response:
+            response_text += chunk.text
+            if stream_answer or action_stream is not None:
+                partial = self._parse_partial(response_text)
+                if partial is not None:
+                    if stream_answer:
+                        shown = self._preview_answer(partial, shown)
+                    if action_stream is not None:
+                        self._stream_actions(partial, action_stream)
+        if shown:
+            print("\n")
+            self._answer_streamed = True
+        return response_text
+    
+    def _find_cached(self, cache_key: tuple, shot_hash: Optional[int]) -> Optional[tuple]:
+        now = time.monotonic()
+        for key in [key for key, entry in self._llm_cache.items() if entry[0] <= now]:
+            del self._llm_cache[key]
+        if cache_key in self._llm_cache:
+            return cache_key
+        if shot_hash is None:
+            return None
+        # Only answers survive a re-encoded screen with the same dhash; a
+        # replayed task plan would click at positions taken from an older frame
+        for key in reversed(self._llm_cache):
+            _, cached_hash, cached_response = self._llm_cache[key]
+            if (key[0] == cache_key[0] and cached_hash == shot_hash
+                    and isinstance(cached_response, dict) and cached_response.get('type') == 'question'):
+                return key
+        return None
+    
+    async def send_to_llm(self, prompt: str, screenshot: Optional[bytes] = None, retry_info: str = None,
+                          stream_answer: bool = False,
+                          action_stream: Optional['ActionStream'] = None) -> Dict[str, Any]:
+        self._answer_streamed = False
+        llm_response = None
         try:
             if not self.model:
                 return {"status": "error", "actions": []}
@@ -324,28 +1031,51 @@ class ConsoleTestBackend:
             if retry_info:
                 content_parts.insert(0, f"RETRY NOTICE: {retry_info}\nPlease revise your plan based on this feedback.")
             
-            if screenshot_path and os.path.exists(screenshot_path):
-                with open(screenshot_path, 'rb') as f:
-                    image_data = f.read()
+            if screenshot:
                 content_parts.append({
-                    "mime_type": "image/png",
-                    "data": image_data
+                    "mime_type": "image/jpeg" if screenshot[:2] == b'\xff\xd8' else "image/png",
+                    "data": screenshot
                 })
             
-            response = self.model.generate_content(content_parts)
-            response_text = response.text.strip()
+            # Same prompt against the same screen gets the same answer; for
+            # questions a matching dhash is enough
+            key = hashlib.sha256()
+            for part in content_parts:
+                if isinstance(part, str):
+                    key.update(part.encode())
+                    key.update(b"\0")
+            cache_key = (key.hexdigest(), hashlib.sha256(screenshot).hexdigest() if screenshot else None)
+            shot_hash = image_dhash(screenshot) if screenshot else None
+            cached_key = self._find_cached(cache_key, shot_hash)
+            if cached_key is not None:
+                self._llm_cache.move_to_end(cached_key)
+                print(f"[LLM] Cache hit\n")
+                llm_response = self._llm_cache[cached_key][2]
+                return llm_response
             
-            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group()
-                else:
-                    raise ValueError("No JSON found")
+            timeout = self.request_timeout
+            for attempt in range(1, self.llm_max_retries + 1):
+                try:
+                    response_text = await asyncio.wait_for(
+                        self._stream_response(content_parts, stream_answer, action_stream), timeout=timeout)
+                    break
+                except asyncio.TimeoutError:
+                    print(f"[LLM] Timed out after {timeout:.1f}s (attempt {attempt}/{self.llm_max_retries})\n")
+                    logger.warning(f"LLM timeout after {timeout:.1f}s (attempt {attempt})")
+                    if attempt == self.llm_max_retries:
+                        raise TimeoutError(f"No response after {attempt} attempts")
+                    # Steps from this reply may already have run; a fresh
+                    # reply would be a different plan
+                    if action_stream is not None and action_stream.received > 0:
+                        raise TimeoutError("Reply timed out after its steps started running")
+                    timeout *= 1.5
+            response_text = response_text.strip()
             
-            llm_response = json.loads(json_str)
+            llm_response = parse_llm_json(extract_json(response_text))
+            self._llm_cache[cache_key] = (time.monotonic() + LLM_CACHE_TTL, shot_hash, llm_response)
+            self._llm_cache.move_to_end(cache_key)
+            if len(self._llm_cache) > self.llm_cache_size:
+                self._llm_cache.popitem(last=False)
             action_count = len(llm_response.get('actions', []))
             print(f"[LLM] Plan: {action_count} steps\n")
             logger.info("LLM response received")
@@ -355,19 +1085,30 @@ class ConsoleTestBackend:
             print(f"[LLM] ERROR: {e}\n")
             logger.error(f"LLM error: {e}")
             return {"status": "error", "actions": []}
+        
+        finally:
+            if action_stream is not None:
+                is_task = isinstance(llm_response, dict) and llm_response.get('type') == 'task'
+                if is_task:
+                    action_stream.finish(llm_response.get('actions') or [],
+                                         {k: llm_response.get(k, '') for k in ('analysis', 'plan')})
+                else:
+                    action_stream.finish([])
     
-    def execute_task(self, user_request: str) -> None:
+    async def execute_task(self, user_request: str) -> None:
         print(f"\n{'='*80}")
         print(f" REQUEST: {user_request}")
         print(f"{'='*80}\n")
         
-        screenshot_path = self.take_screenshot()
-        if not screenshot_path:
+        screenshot = self.take_screenshot_bytes()
+        if not screenshot:
             print("[ERROR] Cannot capture initial screenshot\n")
             return
         
         prompt = f"""User Request: {user_request}
 
+A screenshot of the current screen is attached.
+
 Determine if this is a QUESTION or a TASK:
 - QUESTION: Information request, explanation, asking for knowledge
 - TASK: Action request, computer control needed, something to do on the system
@@ -376,7 +1117,19 @@ Respond with the appropriate JSON format:
 - For QUESTION: {{"type": "question", "response": "Your answer", "requires_action": false}}
 - For TASK: {{"type": "task", "analysis": "...", "plan": "...", "actions": [...]}}"""
         
-        initial_response = self.send_to_llm(prompt, screenshot_path)
+        # Task steps are dispatched as soon as they have streamed in, while
+        # the rest of the plan is still being generated
+        action_stream = ActionStream()
+        llm_task = asyncio.create_task(
+            self.send_to_llm(prompt, screenshot, stream_answer=True, action_stream=action_stream))
+        
+        if await action_stream.wait_for(1):
+            print(f"[TYPE] Task detected\n")
+            await self._execute_task_actions(user_request, action_stream.plan, screenshot, action_stream)
+            await llm_task
+            return
+        
+        initial_response = await llm_task
         
         if initial_response.get('status') == 'error':
             print(f"[ERROR] Failed to process request\n")
@@ -387,25 +1140,30 @@ Respond with the appropriate JSON format:
         if request_type == 'question':
             print(f"[TYPE] Question detected\n")
             response = initial_response.get('response', '')
-            print(f"[ANSWER]\n{response}\n")
+            if not self._answer_streamed:
+                print(f"[ANSWER]\n{response}\n")
             print(f"{'='*80}\n")
             return
         
         elif request_type == 'task':
             print(f"[TYPE] Task detected\n")
-            self._execute_task_actions(user_request, initial_response, screenshot_path)
+            await self._execute_task_actions(user_request, initial_response, screenshot)
         
         else:
             print(f"[ERROR] Unknown request type: {request_type}\n")
     
-    def _execute_task_actions(self, task: str, llm_response: Dict[str, Any], initial_screenshot: str) -> None:
+    async def _execute_task_actions(self, task: str, llm_response: Dict[str, Any], initial_screenshot: bytes,
+                                    action_stream: Optional['ActionStream'] = None) -> None:
         analysis = llm_response.get('analysis', '')
         plan = llm_response.get('plan', '')
         actions = llm_response.get('actions', [])
         
         print(f"[ANALYSIS] {analysis}\n")
         print(f"[PLAN] {plan}\n")
-        print(f"[EXECUTING] {len(actions)} steps\n")
+        if action_stream is not None:
+            print(f"[EXECUTING] steps as they stream in\n")
+        else:
+            print(f"[EXECUTING] {len(actions)} steps\n")
         
         step_results = []
         failed_steps = []
@@ -413,32 +1171,59 @@ Respond with the appropriate JSON format:
         max_retries = 3
         
         while retry_count < max_retries:
-            if retry_count == 0:
-                actions_to_execute = actions
+            streaming = retry_count == 0 and action_stream is not None
+            if streaming:
+                # Grows (already fused) while the reply streams in
+                actions_to_execute = action_stream.actions
+                step_results = []
+                failed_steps = []
+            elif retry_count == 0:
+                actions_to_execute = fuse_actions(actions)
                 step_results = []
                 failed_steps = []
             else:
-                actions_to_execute = retry_actions
+                actions_to_execute = fuse_actions(retry_actions)
                 print(f"\n[RECOVERY ATTEMPT {retry_count}] Executing alternative plan...\n")
             
-            for i, action in enumerate(actions_to_execute, 1):
-                step_desc = action.get('description', f'Step {i}')
-                print(f"[{i}/{len(actions_to_execute)}] {step_desc}")
+            async def available(count: int) -> bool:
+                if streaming:
+                    await action_stream.wait_for(count)
+                return len(actions_to_execute) >= count
+            
+            i = 0
+            while await available(i + 1):
+                # A 'type' step may still absorb the next one, so it waits for
+                # its successor (or the end of the reply) before running
+                if streaming and str(actions_to_execute[i].get('action', '')).lower() == 'type':
+                    await available(i + 2)
                 
-                result = self.execute_action(action)
-                step_results.append(result)
+                # Consecutive terminal steps marked parallel run side by side
+                batch = [actions_to_execute[i]]
+                while (is_parallel_terminal(batch[-1]) and await available(i + len(batch) + 1)
+                       and is_parallel_terminal(actions_to_execute[i + len(batch)])):
+                    batch.append(actions_to_execute[i + len(batch)])
                 
-                if not result['success']:
-                    failed_steps.append({
-                        'step': i,
-                        'action': result['action'],
-                        'message': result['message']
-                    })
-                    print(f"[FAIL] {result['message']}\n")
-                else:
-                    print(f"[OK]\n")
+                total = '?' if streaming and not action_stream.done else len(actions_to_execute)
+                for step, action in enumerate(batch, i + 1):
+                    step_desc = action.get('description', f'Step {step}')
+                    print(f"[{step}/{total}] {step_desc}")
+                
+                results = await asyncio.gather(*(self._dispatch_action(action) for action in batch))
                 
-                time.sleep(0.2)
+                for step, result in enumerate(results, i + 1):
+                    step_results.append(result)
+                    if not result['success']:
+                        failed_steps.append({
+                            'step': step,
+                            'action': result['action'],
+                            'message': result['message']
+                        })
+                        print(f"[FAIL] {result['message']}\n")
+                    else:
+                        print(f"[OK]\n")
+                
+                i += len(batch)
+                await asyncio.sleep(ACTION_SETTLE_DELAY.get(str(batch[-1].get('action', '')).lower(), DEFAULT_SETTLE_DELAY))
             
             if not failed_steps:
                 print(f"\n[SUCCESS] All steps completed successfully!\n")
@@ -450,14 +1235,14 @@ Respond with the appropriate JSON format:
                 print(f"{'='*80}\n")
                 print(f"[RECOVERY] {len(failed_steps)} step(s) failed. Trying alternative approach...\n")
                 
-                retry_screenshot = self.take_screenshot()
-                retry_info = f"Previous plan failed at steps: {[f['step'] for f in failed_steps]}. Errors: {json.dumps(failed_steps)}"
+                retry_screenshot = self.take_screenshot_bytes()
+                retry_info = f"Previous plan failed at steps: {[f['step'] for f in failed_steps]}. Errors: {dump_json(failed_steps)}"
                 
                 retry_prompt = f"""Task: {task}
 
 Previous execution had failures. Analyze current screen and create a COMPLETELY DIFFERENT plan.
 Failed steps details:
-{json.dumps(failed_steps, indent=2)}
+{dump_json(failed_steps, indent=True)}
 
 Try a completely different approach:
 - If you used UI before, try terminal
@@ -469,7 +1254,7 @@ Try a completely different approach:
 Create a better plan that avoids these failures using alternative methods.
 Respond ONLY with JSON for a TASK (type: "task")."""
                 
-                retry_response = self.send_to_llm(retry_prompt, retry_screenshot, retry_info)
+                retry_response = await self.send_to_llm(retry_prompt, retry_screenshot, retry_info)
                 
                 if retry_response.get('status') != 'error' and retry_response.get('type') == 'task':
                     retry_actions = retry_response.get('actions', [])
@@ -483,14 +1268,22 @@ Respond ONLY with JSON for a TASK (type: "task")."""
                 print(f"\n[ERROR] Max retry attempts ({max_retries}) reached. Task may not be completable.\n")
                 break
         
-        final_screenshot = self.take_screenshot()
+        final_screenshot = self.take_screenshot_bytes()
         
         print(f"\n{'='*80}")
         print(f" COMPLETION CHECK")
         print(f"{'='*80}\n")
         
+        executed_steps = "\n".join(
+            f"{i}. {r['action']}: {'OK' if r['success'] else 'FAILED'} - {str(r['message']).strip()[:80]}"
+            for i, r in enumerate(step_results, 1)
+        )
+        
         completion_prompt = f"""Task was: {task}
 
+Executed steps:
+{executed_steps}
+
 Analyze final screenshot and confirm:
 1. Was task completed successfully?
 2. Current system state?
@@ -505,7 +1298,7 @@ Respond ONLY with JSON:
   "status": "success/partial/failed"
 }}"""
         
-        verification = self.send_to_llm(completion_prompt, final_screenshot)
+        verification = await self.send_to_llm(completion_prompt, final_screenshot)
         
         print(f"[COMPLETION] Completed: {verification.get('completed', False)}")
         print(f"[STATE] {verification.get('state', 'Unknown')}\n")
@@ -520,16 +1313,44 @@ Respond ONLY with JSON:
         print(f"Status: {verification.get('status', 'unknown')}")
         print(f"{'='*80}\n")
     
-    def run_console_loop(self) -> None:
+    async def _warm_up_model(self) -> None:
+        # Open the API connection while the user is still typing, so the
+        # first request doesn't pay for it
+        try:
+            await self.model.count_tokens_async("ping")
+        except Exception as e:
+            logger.info(f"Model warm-up skipped: {e}")
+    
+    async def _read_input(self, prompt: str) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        def reader():
+            try:
+                line = input(prompt)
+                loop.call_soon_threadsafe(future.set_result, line)
+            except Exception as e:
+                loop.call_soon_threadsafe(future.set_exception, e)
+        
+        # Daemon thread so a pending input() never blocks interpreter shutdown
+        threading.Thread(target=reader, daemon=True).start()
+        return await future
+    
+    async def run_console_loop(self) -> None:
         print("\n" + "="*80)
         print(" CONTROL - Intelligent AI Assistant & Task Executor")
         print("="*80)
         print("Answer questions OR execute tasks - AI decides based on request type")
-        print("Commands: 'help' | 'screenshot' | 'quit'\n")
+        print("Commands: 'help' | 'screenshot' | 'record [n]' | 'quit'\n")
+        
+        # The model is built here on the loop thread, which is the only
+        # thread that touches it; only the network round-trip runs meanwhile
+        if self.model is not None and self.api_key != "test_api_key":
+            self._warm_up_task = asyncio.create_task(self._warm_up_model())
         
         while self.running:
             try:
-                user_input = input(">> ").strip()
+                user_input = (await self._read_input(">> ")).strip()
                 
                 if not user_input:
                     continue
@@ -541,6 +1362,7 @@ Respond ONLY with JSON:
                 elif user_input.lower() == 'help':
                     print("\nCommands:")
                     print("• screenshot - Capture current screen")
+                    print(f"• record [n] - Capture n frames back-to-back (default 10, max {MAX_STREAM_FRAMES})")
                     print("• quit/exit - Exit program")
                     print("\nQuestion Examples:")
                     print("• 'What is Python?'")
@@ -557,9 +1379,19 @@ Respond ONLY with JSON:
                     print(f"Saved to {path}\n")
                     continue
                 
-                self.execute_task(user_input)
+                record_match = re.fullmatch(r'record(?:\s+(\d+))?', user_input.lower())
+                if record_match:
+                    n_frames = int(record_match.group(1) or 10)
+                    if not 1 <= n_frames <= MAX_STREAM_FRAMES:
+                        print(f"[ERROR] record takes 1-{MAX_STREAM_FRAMES} frames\n")
+                        continue
+                    paths = await asyncio.to_thread(self.capture_stream, n_frames)
+                    print(f"Saved {len(paths)} frames to {self.screenshot_dir}\n")
+                    continue
+                
+                await self.execute_task(user_input)
             
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, asyncio.CancelledError):
                 print("\nExit!")
                 break
             except Exception as e:
@@ -569,7 +1401,12 @@ Respond ONLY with JSON:
 def main():
     try:
         backend = ConsoleTestBackend()
-        backend.run_console_loop()
+        try:
+            asyncio.run(backend.run_console_loop())
+        finally:
+            backend.close()
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"[FATAL] {e}\n")
         sys.exit(1)
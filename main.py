@@ -5,23 +5,32 @@ Combines the enhanced capabilities of console_test_backend.py with the applicati
 Handles device control, screenshot capture, and AI communication with improved error handling and adaptive planning
 """
 
+import io
 import sys
 import json
 import time
 import asyncio
 import logging
 import os
+import shlex
+import shutil
+import functools
+import hashlib
+import itertools
+import signal
 import subprocess
-import re
+import threading
+import contextvars
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Any, Optional
-from datetime import datetime
 
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 if sys.platform == 'win32':
-    import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
@@ -54,7 +63,27 @@ try:
     except ImportError:
         pyperclip = None
     from PIL import Image
-    import google.generativeai as genai
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+    uvloop = None
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+        except ImportError:
+            pass
+    try:
+        # Partial-JSON parsing for previewing answers while they stream
+        from pydantic_core import from_json
+    except ImportError:
+        from_json = None
+    try:
+        import simdjson
+        # One parser for the process; it reuses its buffers across documents
+        json_parser = simdjson.Parser()
+    except ImportError:
+        simdjson = None
     
     try:
         import pyautogui
@@ -68,11 +97,15 @@ except ImportError as e:
     print("[ERROR] Please run: pip install -r requirements.txt", file=sys.stderr)
     sys.exit(1)
 
+# stdout is the message channel to the Electron app (progress prints and
+# JSON replies), so log records go to stderr. The app reports every stderr
+# line as a Python error, so only warnings are logged unless LOG_LEVEL=INFO
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('LOG_LEVEL', 'WARNING').upper(),
     format='%(asctime)s - %(levelname)s - [CONTROL] - %(message)s',
+    datefmt='%H:%M:%S',
     handlers=[
-        logging.StreamHandler(sys.stdout),
+        logging.StreamHandler(sys.stderr),
     ]
 )
 logger = logging.getLogger(__name__)
@@ -123,9 +156,9 @@ SYSTEM_PROMPT = """You are Control, an intelligent AI assistant that can:
 3. double_click - Double click. params: {"coordinates": [x, y]}
 4. mouse_move - Move cursor. params: {"coordinates": [x, y]}
 5. scroll - Scroll wheel. params: {"coordinates": [x, y], "direction": "up|down", "amount": 3}
-6. type - Type text. params: {"text": "hello", "clear_first": false}
+6. type - Type text. params: {"text": "hello", "clear_first": false, "force_typing": false} (long text is pasted; set force_typing for fields that block paste)
 7. key_press - Keys/shortcuts. params: {"keys": ["ctrl", "a"], "combo": true}
-8. terminal - OS command. params: {"command": "command"}
+8. terminal - OS command. params: {"command": "command", "parallel": false} - set parallel true on consecutive commands that don't depend on each other to run them together
 9. wait - Pause. params: {"duration": 1}
 10. focus_window - Switch to app window. params: {"app_name": "Chrome", "method": "alt_tab|search"}
 
@@ -141,18 +174,403 @@ SYSTEM_PROMPT = """You are Control, an intelligent AI assistant that can:
 - If action fails: Try alternative method
 - Speed and precision are both important"""
 
+# The per-request framing is fixed; only the user's message changes. The
+# system prompt itself travels once as the model's system_instruction
+REQUEST_PROMPT_PREFIX = "User Request: "
+REQUEST_PROMPT_SUFFIX = """
+
+Determine if this is a QUESTION or a TASK:
+- QUESTION: Information request, explanation, asking for knowledge
+- TASK: Action request, computer control needed, something to do on the system
+
+Respond with the appropriate JSON format:
+- For QUESTION: {"type": "question", "response": "Your answer", "requires_action": false}
+- For TASK: {"type": "task", "analysis": "...", "plan": "...", "actions": [...]}"""
+
+RETRY_PROMPT_MIDDLE = """
+
+Previous execution had failures. Analyze current screen and create a COMPLETELY DIFFERENT plan.
+Failed steps details:
+"""
+RETRY_PROMPT_SUFFIX = """
+
+Try a completely different approach:
+- If you used UI before, try terminal
+- If you used terminal, try UI
+- Change the method/tool used
+- Be more precise with coordinates (calculate perfectly because a wrong coordinate means a wrong click, note you are using pyautogui for the mouse control so understand how it works)
+- Check app window focus before interacting
+
+Create a better plan that avoids these failures using alternative methods.
+Respond ONLY with JSON for a TASK (type: "task")."""
+
+VERIFY_PROMPT_SUFFIX = """
+
+Analyze final screenshot and confirm:
+1. Was task completed successfully?
+2. Current system state?
+3. Any issues?
+
+Respond ONLY with JSON:
+{
+    "type": "question",
+    "response": "Your assessment (this is just for verification)",
+    "completed": true/false,
+    "state": "Your assessment",
+    "status": "success/partial/failed"
+}"""
+
+MODEL_NAME = 'gemini-2.0-flash'
+# Identical prompt + screenshot pairs (retries, re-asks) are answered from
+# memory for a few minutes instead of another round-trip
+LLM_CACHE_SIZE = 256
+LLM_CACHE_TTL = 300.0
+# Screens whose dhashes differ in fewer bits count as unchanged
+DHASH_MAX_DISTANCE = 4
+
+# Settle time after each action before the next one runs. Terminal commands
+# and waits have already finished when they return; GUI input needs a moment
+# for the target app to react
+ACTION_SETTLE_DELAY = {
+    'screenshot': 0,
+    'terminal': 0,
+    'wait': 0,
+    'mouse_move': 0.02,
+    'type': 0.05,
+    'click': 0.1,
+    'double_click': 0.1,
+    'scroll': 0.1,
+    'key_press': 0.1,
+    'focus_window': 0.3,
+}
+DEFAULT_SETTLE_DELAY = 0.2
+
+SHELL_BUILTINS = {
+    'cd', 'chdir', 'dir', 'echo', 'set', 'export', 'source', 'alias', 'type', 'copy', 'move',
+    'del', 'erase', 'ren', 'rename', 'md', 'mkdir', 'rd', 'rmdir', 'start', 'call', 'cls',
+    'pushd', 'popd', 'exit', 'mklink', 'assoc', 'ftype', 'title', 'ver', 'vol',
+}
+SHELL_METACHARS = frozenset('|&;<>()$`*?~%^!\n')
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+MAX_CONCURRENT_COMMANDS = 4
+NET_OK_TTL = 15.0
+MAX_CONCURRENT_MESSAGES = 4
+MESSAGE_QUEUE_SIZE = 16
+
+@functools.lru_cache(maxsize=None)
+def get_genai():
+    # The SDK pulls in grpc/protobuf (~0.5 s); it is imported off the startup
+    # path on a background thread
+    import google.generativeai as genai
+    return genai
+
+@functools.lru_cache(maxsize=128)
+def resolve_executable(name: str) -> Optional[str]:
+    return shutil.which(name)
+
+def split_command(command: str) -> Optional[list]:
+    # argv for running without a shell, or None when a shell is required
+    if not command or SHELL_METACHARS.intersection(command):
+        return None
+    try:
+        argv = shlex.split(command, posix=(os.name != 'nt'))
+    except ValueError:
+        return None
+    if os.name == 'nt':
+        argv = [arg[1:-1] if len(arg) > 1 and arg[0] == arg[-1] == '"' else arg for arg in argv]
+    if not argv or argv[0].lower() in SHELL_BUILTINS:
+        return None
+    executable = resolve_executable(argv[0])
+    if executable is None:
+        return None
+    return [executable] + argv[1:]
+
+async def kill_process(proc) -> None:
+    # On POSIX commands run in their own session, so the whole group goes:
+    # a shell's children hold the output pipes too, and wait() only returns
+    # once those close. Elsewhere only the direct child can be killed, so
+    # the wait for it is bounded
+    if os.name != 'nt':
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        proc.kill()
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=1)
+    except asyncio.TimeoutError:
+        pass
+
+def image_dhash(image_bytes: bytes) -> int:
+    # 64-bit difference hash: brightness gradients of a 9x8 grayscale
+    # thumbnail. draft() lets the JPEG decoder produce it at 1/8 scale
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft('L', (72, 64))
+    pixels = list(img.convert('L').resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits
+
+def is_parallel_terminal(action: Dict[str, Any]) -> bool:
+    return (str(action.get('action', '')).lower() == 'terminal'
+            and bool((action.get('parameters') or {}).get('parallel')))
+
+async def read_head(stream: asyncio.StreamReader, limit: int = 800) -> bytes:
+    # Keeps only the start of a pipe; the rest is drained and dropped so the
+    # child never blocks on a full pipe and large output isn't buffered
+    head = bytearray()
+    while len(head) < limit:
+        chunk = await stream.read(limit - len(head))
+        if not chunk:
+            return bytes(head)
+        head += chunk
+    while await stream.read(65536):
+        pass
+    return bytes(head)
+
+def load_json(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dump_json(obj: Any, indent: bool = False) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, indent=2 if indent else None)
+
+def extract_json(response_text: str) -> str:
+    _, fence, rest = response_text.partition("```json")
+    if fence:
+        body, closing, _ = rest.partition("```")
+        if closing:
+            return body.strip()
+    start = response_text.find('{')
+    end = response_text.rfind('}')
+    if start >= 0 and end > start:
+        return response_text[start:end + 1]
+    raise ValueError("No JSON found")
+
+class JsonObjectScanner:
+    # Incremental brace-depth scan over streamed text; feed() returns the
+    # length of text seen so far once the first top-level object closes
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.seen = 0
+
+    def feed(self, chunk: str) -> Optional[int]:
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.depth > 0
+            elif ch == '{':
+                self.depth += 1
+            elif ch == '}' and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    return self.seen + i + 1
+        self.seen += len(chunk)
+        return None
+
+def parse_llm_json(json_str: str, question_fields: Optional[tuple] = None) -> Dict[str, Any]:
+    if simdjson is not None:
+        doc = json_parser.parse(json_str.encode())
+        if isinstance(doc, simdjson.Array):
+            # Proxies into the shared parser go stale on its next parse
+            return doc.as_list()
+        if not isinstance(doc, simdjson.Object):
+            return doc
+        if question_fields and doc.get('type') == 'question':
+            # A plain answer only needs a few scalar fields, so the rest of
+            # the tree is never turned into Python objects
+            picked = {key: doc[key] for key in question_fields if key in doc}
+            if not any(isinstance(value, (simdjson.Object, simdjson.Array)) for value in picked.values()):
+                return picked
+        # as_dict() copies out of the parser's buffer before it is reused
+        return doc.as_dict()
+    return load_json(json_str)
+
+# Set per incoming message; messages are handled concurrently, so every
+# reply (partial or final) carries the id of the request it answers
+current_request_id = contextvars.ContextVar('current_request_id', default=None)
+# Scale of the last screenshot this request uploaded; the model's
+# coordinates are in that image's pixels
+upload_scale = contextvars.ContextVar('upload_scale', default=1.0)
+
+def write_message(message: Dict[str, Any]) -> None:
+    # Responses go out as one UTF-8 line in a single write on the fd. Pending
+    # text-layer prints are flushed first so the order on the pipe is preserved
+    request_id = current_request_id.get()
+    if request_id is not None:
+        message = {**message, 'request_id': request_id}
+    sys.stdout.flush()
+    if orjson is not None:
+        data = orjson.dumps(message) + b"\n"
+    else:
+        data = json.dumps(message).encode() + b"\n"
+    fd = sys.stdout.fileno()
+    view = memoryview(data)
+    while view:
+        # A pipe may take less than the whole line when its buffer is full
+        view = view[os.write(fd, view):]
+
+if sys.platform == 'win32':
+    # SendInput talks to the input queue directly, skipping pyautogui's
+    # per-call sleeps and its one-event-per-call mouse_event/keybd_event path
+    import ctypes
+    from ctypes import wintypes
+    
+    INPUT_MOUSE = 0
+    INPUT_KEYBOARD = 1
+    MOUSEEVENTF_MOVE = 0x0001
+    MOUSEEVENTF_LEFTDOWN = 0x0002
+    MOUSEEVENTF_LEFTUP = 0x0004
+    MOUSEEVENTF_WHEEL = 0x0800
+    MOUSEEVENTF_VIRTUALDESK = 0x4000
+    MOUSEEVENTF_ABSOLUTE = 0x8000
+    KEYEVENTF_KEYUP = 0x0002
+    KEYEVENTF_UNICODE = 0x0004
+    VK_RETURN = 0x0D
+    WHEEL_DELTA = 120
+    SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN = 76, 77, 78, 79
+    
+    class MOUSEINPUT(ctypes.Structure):
+        _fields_ = [('dx', wintypes.LONG), ('dy', wintypes.LONG), ('mouseData', wintypes.DWORD),
+                    ('dwFlags', wintypes.DWORD), ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+    
+    class KEYBDINPUT(ctypes.Structure):
+        _fields_ = [('wVk', wintypes.WORD), ('wScan', wintypes.WORD), ('dwFlags', wintypes.DWORD),
+                    ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+    
+    class HARDWAREINPUT(ctypes.Structure):
+        _fields_ = [('uMsg', wintypes.DWORD), ('wParamL', wintypes.WORD), ('wParamH', wintypes.WORD)]
+    
+    class _INPUTUNION(ctypes.Union):
+        _fields_ = [('mi', MOUSEINPUT), ('ki', KEYBDINPUT), ('hi', HARDWAREINPUT)]
+    
+    class INPUT(ctypes.Structure):
+        _anonymous_ = ('u',)
+        _fields_ = [('type', wintypes.DWORD), ('u', _INPUTUNION)]
+    
+    user32 = ctypes.WinDLL('user32', use_last_error=True)
+    user32.SendInput.argtypes = (wintypes.UINT, ctypes.POINTER(INPUT), ctypes.c_int)
+    user32.SendInput.restype = wintypes.UINT
+    
+    def send_inputs(events: list) -> None:
+        # One call for the whole sequence, so it can't be interleaved with
+        # real user input
+        arr = (INPUT * len(events))(*events)
+        if user32.SendInput(len(events), arr, ctypes.sizeof(INPUT)) != len(events):
+            raise ctypes.WinError(ctypes.get_last_error())
+    
+    def win_mouse_input(flags: int, dx: int = 0, dy: int = 0, data: int = 0):
+        return INPUT(type=INPUT_MOUSE, mi=MOUSEINPUT(dx, dy, data & 0xFFFFFFFF, flags, 0, 0))
+    
+    def win_move_input(x: int, y: int):
+        # Absolute coordinates are normalized to 0..65535 across the virtual desktop
+        left = user32.GetSystemMetrics(SM_XVIRTUALSCREEN)
+        top = user32.GetSystemMetrics(SM_YVIRTUALSCREEN)
+        width = max(user32.GetSystemMetrics(SM_CXVIRTUALSCREEN) - 1, 1)
+        height = max(user32.GetSystemMetrics(SM_CYVIRTUALSCREEN) - 1, 1)
+        return win_mouse_input(MOUSEEVENTF_MOVE | MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK,
+                               (x - left) * 65535 // width, (y - top) * 65535 // height)
+    
+    def win_text_inputs(text: str) -> list:
+        events = []
+        utf16 = text.replace('\r\n', '\n').encode('utf-16-le')
+        for i in range(0, len(utf16), 2):
+            unit = int.from_bytes(utf16[i:i + 2], 'little')
+            if unit == 0x0A:
+                down = KEYBDINPUT(VK_RETURN, 0, 0, 0, 0)
+                up = KEYBDINPUT(VK_RETURN, 0, KEYEVENTF_KEYUP, 0, 0)
+            else:
+                down = KEYBDINPUT(0, unit, KEYEVENTF_UNICODE, 0, 0)
+                up = KEYBDINPUT(0, unit, KEYEVENTF_UNICODE | KEYEVENTF_KEYUP, 0, 0)
+            events.append(INPUT(type=INPUT_KEYBOARD, ki=down))
+            events.append(INPUT(type=INPUT_KEYBOARD, ki=up))
+        return events
+
+def requires_gui(handler):
+    @functools.wraps(handler)
+    def wrapper(self, params, result):
+        if not (GUI_AVAILABLE and pyautogui):
+            result["message"] = "GUI control not available"
+            return
+        handler(self, params, result)
+    return wrapper
+
 class EnhancedComputerUseAgent:
     def __init__(self):
         self.running = True
         self.screenshot_dir = project_root / "screenshots"
         self.screenshot_dir.mkdir(exist_ok=True)
         self.execution_history = []
+        self.api_key = None
+        self._sct = None
+        self._monitor = None
+        self._sct_lock = threading.Lock()
+        self._dxcam = None
+        self._last_frame = None
+        # PNG encode + write runs here so the next action (or LLM round-trip)
+        # can start while the file is still being written
+        self._screenshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shot-save')
+        self._pending_saves = {}
+        self._shot_seq = itertools.count()
+        # Long edge of screenshots saved to disk, and of the smaller ones
+        # uploaded to the model; the model answers in the upload's pixels
+        self._shot_max_dim = int(os.getenv('CTRL_SHOT_MAX_DIM', '1920'))
+        self._upload_max_dim = int(os.getenv('CTRL_UPLOAD_MAX_DIM', '1280'))
+        self._dispatch = {
+            'screenshot': self._act_screenshot,
+            'click': self._act_click,
+            'double_click': self._act_double_click,
+            'mouse_move': self._act_mouse_move,
+            'scroll': self._act_scroll,
+            'type': self._act_type,
+            'key_press': self._act_key_press,
+            'terminal': self._act_terminal,
+            'wait': self._act_wait,
+            'focus_window': self._act_focus_window,
+        }
+        self._net_ok_until = 0.0
+        self._model_cache = {}
+        self._configured_key = None
+        # Models are set up on the startup thread and on the event loop
+        self._model_lock = threading.Lock()
+        self._valid_keys = set()
+        self._llm_cache = OrderedDict()
+        self._verdicts = {}
+        # One event loop for the whole session instead of a fresh loop (and
+        # executor) per message
+        self._loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+        self._exec_sema = asyncio.Semaphore(MAX_CONCURRENT_COMMANDS)
+        self._message_sema = asyncio.Semaphore(MAX_CONCURRENT_MESSAGES)
+        # Only one plan drives the mouse and keyboard at a time
+        self._task_lock = asyncio.Lock()
+        asyncio.set_event_loop(self._loop)
         
-        self.setup_gemini_api()
+        self._ai_ready = threading.Event()
+        threading.Thread(target=self._setup_ai_background, name='ai-setup', daemon=True).start()
         self.setup_computer_control()
         
         print("[INIT] Enhanced Computer Use Agent initialized\n")
-        logger.info("Enhanced Computer Use Agent initialized")
+
+    def _setup_ai_background(self):
+        try:
+            self.setup_gemini_api()
+        finally:
+            self._ai_ready.set()
 
     def setup_gemini_api(self):
         api_key = os.getenv('GEMINI_FREE_KEY')
@@ -163,73 +581,231 @@ class EnhancedComputerUseAgent:
             return
 
         try:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash', 
-                                             system_instruction=SYSTEM_PROMPT)
+            self.model = self._get_model(api_key)
             self.api_key = api_key
             print("[AI] Gemini AI client initialized successfully\n")
-            logger.info("Gemini AI client initialized successfully")
         except Exception as e:
             print(f"[AI] ERROR: Failed to initialize AI client: {e}\n")
             logger.error(f"Failed to initialize AI client: {e}")
             self.model = None
 
+    def _get_model(self, key: str):
+        # genai.configure swaps the process-wide client, so only touch it when
+        # the key actually changes; models bind their client on first use
+        genai = get_genai()
+        with self._model_lock:
+            if key != self._configured_key:
+                genai.configure(api_key=key)
+                self._configured_key = key
+            model = self._model_cache.get(key)
+            if model is None:
+                model = genai.GenerativeModel(MODEL_NAME, system_instruction=SYSTEM_PROMPT)
+                self._model_cache[key] = model
+            return model
+
     def setup_computer_control(self):
         try:
             if GUI_AVAILABLE and pyautogui:
                 pyautogui.FAILSAFE = True
-                pyautogui.PAUSE = 0.05
+                # Steps are already spaced by the settle delay in the action loop
+                pyautogui.PAUSE = 0
                 print("[CONTROL] GUI libraries ready\n")
 
             try:
-                with mss.mss() as sct:
-                    monitors = sct.monitors
-                    print(f"[CONTROL] {len(monitors)-1} monitor(s) detected\n")
+                # Kept open for the whole session so each capture reuses the
+                # platform handles instead of re-initializing them
+                self._sct = mss.mss()
+                monitors = self._sct.monitors
+                self._monitor = monitors[1]
+                print(f"[CONTROL] {len(monitors)-1} monitor(s) detected\n")
             except Exception as e:
                 print(f"[CONTROL] WARNING: {e}\n")
+
+            # DXGI Desktop Duplication is much faster than GDI BitBlt on
+            # Windows; elsewhere mss already uses the native API
+            if sys.platform == 'win32':
+                try:
+                    import dxcam
+                    self._dxcam = dxcam.create(output_color="RGB")
+                    print("[CONTROL] DXcam capture enabled\n")
+                except Exception as e:
+                    logger.info(f"DXcam unavailable, using mss: {e}")
         except Exception as e:
             print(f"[CONTROL] ERROR: {e}\n")
 
+    def close(self) -> None:
+        self._screenshot_executor.shutdown(wait=True)
+        with self._sct_lock:
+            if self._dxcam is not None:
+                self._dxcam.release()
+                self._dxcam = None
+            if self._sct is not None:
+                self._sct.close()
+                self._sct = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
     async def check_internet(self) -> bool:
+        # A successful probe (or LLM reply) is trusted for a while, so a burst
+        # of messages doesn't pay for a TCP handshake each
+        now = time.monotonic()
+        if now < self._net_ok_until:
+            return True
         try:
-            import socket
-            socket.create_connection(("8.8.8.8", 53), timeout=3)
+            # Connect on the event loop itself; no executor thread to hand off to
+            _, writer = await asyncio.wait_for(asyncio.open_connection("8.8.8.8", 53), timeout=3)
+            writer.close()
+            self._net_ok_until = now + NET_OK_TTL
             return True
-        except OSError:
+        except (OSError, asyncio.TimeoutError):
             return False
 
     async def validate_api_key(self, key: str) -> bool:
         if not key:
             return False
+        if key in self._valid_keys:
+            return True
         try:
-            genai.configure(api_key=key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            response = model.generate_content("test")
+            self._get_model(key)
+            # A model metadata lookup proves the key without spending an
+            # inference call; it runs off the event loop
+            await self._loop.run_in_executor(
+                None, functools.partial(get_genai().get_model, f"models/{MODEL_NAME}",
+                                        request_options={"timeout": 10}))
+            self._valid_keys.add(key)
             return True
         except Exception as e:
             print(f"[AI] ERROR: API key validation failed: {e}\n")
             logger.error(f"API key validation failed: {e}")
+            self._model_cache.pop(key, None)
+            if self.api_key:
+                self._get_model(self.api_key)
             return False
 
-    def take_screenshot(self) -> str:
+    def grab_screen(self):
+        with self._sct_lock:
+            if self._dxcam is not None:
+                frame = self._dxcam.grab()
+                # grab() returns None when nothing changed since the last frame
+                if frame is not None:
+                    self._last_frame = Image.fromarray(frame)
+                if self._last_frame is not None:
+                    return self._last_frame
+            if self._sct is None:
+                raise RuntimeError("Screen capture not available")
+            sct_img = self._sct.grab(self._monitor)
+        # BGRX raw decoder reads the mss buffer directly, skipping the
+        # repacked .rgb copy
+        return Image.frombuffer("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX", 0, 1)
+
+    def _capture_image(self, max_dim: int, for_upload: bool = True):
+        img = self.grab_screen()
+        w, h = img.size
+        scale = min(1.0, max_dim / max(w, h))
+        if scale < 1.0:
+            img = img.resize((round(w * scale), round(h * scale)), Image.BILINEAR)
+        if for_upload:
+            upload_scale.set(scale)
+        return img
+
+    @staticmethod
+    def _encode_jpeg(img) -> bytes:
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=85)
+        return buf.getvalue()
+
+    def capture_bytes(self) -> bytes:
+        # In-memory JPEG for the LLM; nothing touches the disk
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"screenshot_{timestamp}.png"
-            filepath = self.screenshot_dir / filename
+            return self._encode_jpeg(self._capture_image(self._upload_max_dim))
+        except Exception as e:
+            logger.error(f"Screenshot error: {e}")
+            return b""
 
-            with mss.mss() as sct:
-                monitor = sct.monitors[1]  # Use primary monitor
-                sct_img = sct.grab(monitor)
-                img = Image.frombytes("RGB", sct_img.size, sct_img.rgb)
-                img.save(filepath)
+    async def capture_bytes_async(self) -> bytes:
+        # The grab stays on this thread (capture handles are thread-bound);
+        # the JPEG encode runs on the screenshot worker
+        try:
+            img = self._capture_image(self._upload_max_dim)
+            return await self._loop.run_in_executor(self._screenshot_executor, self._encode_jpeg, img)
+        except Exception as e:
+            logger.error(f"Screenshot error: {e}")
+            return b""
 
-            logger.info(f"Screenshot saved: {filepath}")
-            return str(filepath)
+    def save_screenshot(self) -> str:
+        try:
+            # Second-resolution names collided for back-to-back shots
+            filename = f"screenshot_{time.time_ns()}_{next(self._shot_seq)}.jpg"
+            filepath = str(self.screenshot_dir / filename)
+            img = self._capture_image(self._shot_max_dim, for_upload=False)
+            # JPEG q85 encodes several times faster than PNG deflate
+            future = self._screenshot_executor.submit(img.save, filepath, 'JPEG', quality=85)
+            self._pending_saves[filepath] = future
+            future.add_done_callback(lambda f: self._screenshot_saved(filepath, f))
+            return filepath
         
         except Exception as e:
             logger.error(f"Screenshot error: {e}")
             return ""
 
+    def _screenshot_saved(self, filepath: str, future) -> None:
+        self._pending_saves.pop(filepath, None)
+        if future.exception():
+            logger.error(f"Screenshot error: {future.exception()}")
+        else:
+            logger.info(f"Screenshot saved: {filepath}")
+
+    async def wait_for_screenshot(self, filepath: str) -> bool:
+        future = self._pending_saves.get(filepath)
+        if future is not None:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception:
+                return False
+            return True
+        return bool(filepath) and os.path.exists(filepath)
+
+    def _to_screen(self, coordinates) -> tuple:
+        x, y = coordinates
+        scale = upload_scale.get()
+        return round(x / scale), round(y / scale)
+
+    def _send_click(self, x: int, y: int, clicks: int = 1) -> None:
+        if sys.platform == 'win32':
+            events = [win_move_input(x, y)]
+            for _ in range(clicks):
+                events.append(win_mouse_input(MOUSEEVENTF_LEFTDOWN))
+                events.append(win_mouse_input(MOUSEEVENTF_LEFTUP))
+            send_inputs(events)
+        else:
+            pyautogui.click(x, y, clicks=clicks)
+
+    def _send_move(self, x: int, y: int) -> None:
+        if sys.platform == 'win32':
+            send_inputs([win_move_input(x, y)])
+        else:
+            pyautogui.moveTo(x, y)
+
+    def _send_scroll(self, x: int, y: int, clicks: int) -> None:
+        # Positive clicks scroll up, as with pyautogui.scroll
+        if sys.platform == 'win32':
+            send_inputs([win_move_input(x, y),
+                         win_mouse_input(MOUSEEVENTF_WHEEL, data=clicks * WHEEL_DELTA)])
+        else:
+            pyautogui.moveTo(x, y)
+            pyautogui.scroll(clicks)
+
+    def _send_text(self, text: str) -> None:
+        if sys.platform == 'win32':
+            if text:
+                send_inputs(win_text_inputs(text))
+        else:
+            pyautogui.write(text)
+
     def execute_action(self, action: Dict[str, Any]) -> Dict[str, Any]:
         result = {"success": False, "message": "", "action": action.get('action')}
         
@@ -237,112 +813,9 @@ class EnhancedComputerUseAgent:
             action_type = action.get('action', '').lower()
             params = action.get('parameters', {})
 
-            if action_type == 'screenshot':
-                filepath = self.take_screenshot()
-                result["success"] = bool(filepath)
-                result["message"] = filepath
-                print(f"[SCREENSHOT] Captured\n")
-
-            elif action_type == 'click':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.click(x, y)
-                    result["success"] = True
-                    result["message"] = f"Clicked ({x}, {y})"
-                    print(f"[CLICK] ({x}, {y})\n")
-
-            elif action_type == 'double_click':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.click(x, y, clicks=2)
-                    result["success"] = True
-                    result["message"] = f"Double-clicked ({x}, {y})"
-                    print(f"[DOUBLE_CLICK] ({x}, {y})\n")
-
-            elif action_type == 'mouse_move':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.moveTo(x, y)
-                    result["success"] = True
-                    result["message"] = f"Moved to ({x}, {y})"
-                    print(f"[MOUSE_MOVE] ({x}, {y})\n")
-
-            elif action_type == 'scroll':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [500, 500])
-                    direction = params.get('direction', 'down')
-                    amount = params.get('amount', 3)
-                    scroll_amount = amount if direction == 'down' else -amount
-                    pyautogui.moveTo(x, y)
-                    pyautogui.scroll(scroll_amount)
-                    result["success"] = True
-                    result["message"] = f"Scrolled {direction} by {amount}"
-                    print(f"[SCROLL] {direction} x{amount}\n")
-
-            elif action_type == 'type':
-                if GUI_AVAILABLE and pyautogui:
-                    text = params.get('text', '')
-                    clear_first = params.get('clear_first', False)
-                    if clear_first:
-                        pyautogui.hotkey('ctrl', 'a')
-                        time.sleep(0.1)
-                    pyautogui.write(text)
-                    result["success"] = True
-                    result["message"] = f"Typed: {text[:30]}"
-                    print(f"[TYPE] {text[:30]}\n")
-
-            elif action_type == 'key_press':
-                if GUI_AVAILABLE and pyautogui:
-                    keys = params.get('keys', [])
-                    combo = params.get('combo', len(keys) > 1)
-                    if combo and len(keys) > 1:
-                        pyautogui.hotkey(*keys)
-                    else:
-                        for key in keys:
-                            pyautogui.press(key)
-                    result["success"] = True
-                    result["message"] = f"Keys: {'+'.join(keys)}"
-                    print(f"[KEY_PRESS] {'+'.join(keys)}\n")
-
-            elif action_type == 'terminal':
-                command = params.get('command', '')
-                try:
-                    output = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=10)
-                    result["success"] = output.returncode == 0
-                    result["message"] = output.stdout[:200] if output.stdout else output.stderr[:200]
-                    print(f"[TERMINAL] {command}\n")
-                except Exception as e:
-                    result["message"] = str(e)
-
-            elif action_type == 'wait':
-                duration = params.get('duration', 1)
-                time.sleep(duration)
-                result["success"] = True
-                result["message"] = f"Waited {duration}s"
-                print(f"[WAIT] {duration}s\n")
-
-            elif action_type == 'focus_window':
-                if GUI_AVAILABLE and pyautogui:
-                    app_name = params.get('app_name', '')
-                    method = params.get('method', 'alt_tab')
-
-                    if method == 'alt_tab':
-                        pyautogui.hotkey('alt', 'tab')
-                        result["success"] = True
-                        result["message"] = f"Alt+Tab to switch window"
-                        print(f"[FOCUS_WINDOW] Alt+Tab\n")
-                    elif method == 'search':
-                        pyautogui.hotkey('win')
-                        time.sleep(0.3)
-                        pyautogui.write(app_name)
-                        time.sleep(0.5)
-                        pyautogui.press('enter')
-                        result["success"] = True
-                        result["message"] = f"Opened/focused {app_name}"
-                        print(f"[FOCUS_WINDOW] Searching for {app_name}\n")
-                    else:
-                        result["message"] = f"Unknown focus method: {method}"
-
+            handler = self._dispatch.get(action_type)
+            if handler:
+                handler(params, result)
             else:
                 result["message"] = f"Unknown action: {action_type}"
 
@@ -353,7 +826,199 @@ class EnhancedComputerUseAgent:
 
         return result
 
-    def send_to_llm(self, prompt: str, screenshot_path: str = None, retry_info: str = None) -> Dict[str, Any]:
+    def _act_screenshot(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        filepath = self.save_screenshot()
+        result["success"] = bool(filepath)
+        result["message"] = filepath
+        print(f"[SCREENSHOT] Captured\n")
+
+    @requires_gui
+    def _act_click(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        self._send_click(x, y)
+        result["success"] = True
+        result["message"] = f"Clicked ({x}, {y})"
+        print(f"[CLICK] ({x}, {y})\n")
+
+    @requires_gui
+    def _act_double_click(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        self._send_click(x, y, clicks=2)
+        result["success"] = True
+        result["message"] = f"Double-clicked ({x}, {y})"
+        print(f"[DOUBLE_CLICK] ({x}, {y})\n")
+
+    @requires_gui
+    def _act_mouse_move(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        self._send_move(x, y)
+        result["success"] = True
+        result["message"] = f"Moved to ({x}, {y})"
+        print(f"[MOUSE_MOVE] ({x}, {y})\n")
+
+    @requires_gui
+    def _act_scroll(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [500, 500]))
+        direction = params.get('direction', 'down')
+        amount = params.get('amount', 3)
+        self._send_scroll(x, y, -amount if direction == 'down' else amount)
+        result["success"] = True
+        result["message"] = f"Scrolled {direction} by {amount}"
+        print(f"[SCROLL] {direction} x{amount}\n")
+
+    @requires_gui
+    def _act_type(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        text = params.get('text', '')
+        clear_first = params.get('clear_first', False)
+        if clear_first:
+            pyautogui.hotkey('ctrl', 'a')
+            time.sleep(0.1)
+        if pyperclip and len(text) > 32 and not params.get('force_typing'):
+            # One paste instead of a keystroke per character; a
+            # trailing newline is pressed so it still submits
+            body = text.rstrip('\n')
+            if body:
+                pyperclip.copy(body)
+                pyautogui.hotkey('command' if sys.platform == 'darwin' else 'ctrl', 'v')
+            for _ in range(len(text) - len(body)):
+                pyautogui.press('enter')
+        else:
+            self._send_text(text)
+        result["success"] = True
+        result["message"] = f"Typed: {text[:30]}"
+        print(f"[TYPE] {text[:30]}\n")
+
+    @requires_gui
+    def _act_key_press(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        keys = params.get('keys', [])
+        combo = params.get('combo', len(keys) > 1)
+        if combo and len(keys) > 1:
+            pyautogui.hotkey(*keys)
+        else:
+            for key in keys:
+                pyautogui.press(key)
+        result["success"] = True
+        result["message"] = f"Keys: {'+'.join(keys)}"
+        print(f"[KEY_PRESS] {'+'.join(keys)}\n")
+
+    def _act_terminal(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        # execute_action runs on a worker thread; the command itself goes
+        # through run_terminal on the event loop, so a timeout is handled
+        # the same way on both paths
+        future = asyncio.run_coroutine_threadsafe(
+            self.run_terminal({'action': result['action'], 'parameters': params}), self._loop)
+        result.update(future.result())
+
+    def _act_wait(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        duration = params.get('duration', 1)
+        time.sleep(duration)
+        result["success"] = True
+        result["message"] = f"Waited {duration}s"
+        print(f"[WAIT] {duration}s\n")
+
+    @requires_gui
+    def _act_focus_window(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        app_name = params.get('app_name', '')
+        method = params.get('method', 'alt_tab')
+
+        if method == 'alt_tab':
+            pyautogui.hotkey('alt', 'tab')
+            result["success"] = True
+            result["message"] = f"Alt+Tab to switch window"
+            print(f"[FOCUS_WINDOW] Alt+Tab\n")
+        elif method == 'search':
+            pyautogui.hotkey('win')
+            time.sleep(0.3)
+            self._send_text(app_name)
+            time.sleep(0.5)
+            pyautogui.press('enter')
+            result["success"] = True
+            result["message"] = f"Opened/focused {app_name}"
+            print(f"[FOCUS_WINDOW] Searching for {app_name}\n")
+        else:
+            result["message"] = f"Unknown focus method: {method}"
+
+    async def run_terminal(self, action: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"success": False, "message": "", "action": action.get('action')}
+        command = (action.get('parameters') or {}).get('command', '')
+        try:
+            async with self._exec_sema:
+                # Plain "program args" commands skip the extra shell process
+                argv = split_command(command)
+                if argv is None:
+                    proc = await asyncio.create_subprocess_shell(
+                        command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                        creationflags=CREATE_NO_WINDOW, start_new_session=(os.name != 'nt'))
+                else:
+                    proc = await asyncio.create_subprocess_exec(
+                        *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                        creationflags=CREATE_NO_WINDOW, start_new_session=(os.name != 'nt'))
+                try:
+                    stdout, stderr, _ = await asyncio.wait_for(asyncio.gather(
+                        read_head(proc.stdout), read_head(proc.stderr), proc.wait()), timeout=10)
+                except asyncio.TimeoutError:
+                    await kill_process(proc)
+                    raise TimeoutError(f"Command '{command}' timed out after 10 seconds")
+            # Only the stream that is reported gets decoded, and only its head
+            output = stdout or stderr
+            result["success"] = proc.returncode == 0
+            result["message"] = output.decode(errors='replace')[:200]
+            print(f"[TERMINAL] {command}\n")
+        except Exception as e:
+            result["message"] = str(e)
+        return result
+
+    async def _dispatch_action(self, action: Dict[str, Any]) -> Dict[str, Any]:
+        action_type = str(action.get('action', '')).lower()
+        if action_type == 'terminal':
+            return await self.run_terminal(action)
+        if action_type == 'screenshot':
+            return self.execute_action(action)
+        # Input injection and waits run off the event loop
+        return await asyncio.to_thread(self.execute_action, action)
+
+    def _preview_answer(self, response_text: str, shown: int) -> int:
+        # Forward a question's answer to the app as it streams in
+        start = response_text.find('{')
+        if start < 0:
+            return shown
+        try:
+            partial = from_json(response_text[start:], allow_partial='trailing-strings')
+        except ValueError:
+            return shown
+        if not isinstance(partial, dict) or partial.get('type') != 'question':
+            return shown
+        answer = partial.get('response')
+        if not isinstance(answer, str) or len(answer) <= shown:
+            return shown
+        write_message({
+            'type': 'ai_response_partial',
+            'content': answer,
+            'action_log': f"Answering... ({len(answer)} chars)",
+        })
+        return len(answer)
+
+    async def _stream_response(self, content_parts, stream_answer: bool = False) -> str:
+        # Stop reading as soon as the reply's JSON object closes instead of
+        # waiting for the model to finish the trailing tokens
+        response = await self.model.generate_content_async(content_parts, stream=True)
+        scanner = JsonObjectScanner()
+        response_text = ""
+        shown = 0
+        stream_answer = stream_answer and from_json is not None
+        async for chunk in response:
+            text = chunk.text
+            end = scanner.feed(text)
+            response_text += text
+            if end is not None:
+                return response_text[:end]
+            if stream_answer:
+                shown = self._preview_answer(response_text, shown)
+        return response_text
+
+    async def send_to_llm(self, prompt: str, screenshot: Optional[bytes] = None, retry_info: str = None,
+                          question_fields: Optional[tuple] = None, use_cache: bool = True,
+                          stream_answer: bool = False) -> Dict[str, Any]:
         try:
             if not self.model:
                 return {"status": "error", "actions": []}
@@ -365,31 +1030,34 @@ class EnhancedComputerUseAgent:
             if retry_info:
                 content_parts.insert(0, f"RETRY NOTICE: {retry_info}\nPlease revise your plan based on this feedback.")
 
-            if screenshot_path and os.path.exists(screenshot_path):
-                with open(screenshot_path, 'rb') as f:
-                    image_data = f.read()
+            if screenshot:
                 content_parts.append({
-                    "mime_type": "image/png",
-                    "data": image_data
+                    "mime_type": "image/jpeg" if screenshot[:2] == b'\xff\xd8' else "image/png",
+                    "data": screenshot
                 })
 
-            response = self.model.generate_content(content_parts)
-            response_text = response.text.strip()
-
-            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group()
-                else:
-                    raise ValueError("No JSON found")
-
-            llm_response = json.loads(json_str)
+            key = hashlib.blake2b(MODEL_NAME.encode())
+            for part in content_parts:
+                key.update(b"\0")
+                key.update(part.encode() if isinstance(part, str) else part["data"])
+            cache_key = key.digest()
+            cached = self._llm_cache.get(cache_key) if use_cache else None
+            if cached is not None and cached[0] > time.monotonic():
+                self._llm_cache.move_to_end(cache_key)
+                print(f"[LLM] Cache hit\n")
+                return cached[1]
+
+            response_text = (await self._stream_response(content_parts, stream_answer)).strip()
+
+            # A reply from the API is as good as a connectivity probe
+            self._net_ok_until = time.monotonic() + NET_OK_TTL
+            llm_response = parse_llm_json(extract_json(response_text), question_fields)
+            self._llm_cache[cache_key] = (time.monotonic() + LLM_CACHE_TTL, llm_response)
+            self._llm_cache.move_to_end(cache_key)
+            if len(self._llm_cache) > LLM_CACHE_SIZE:
+                self._llm_cache.popitem(last=False)
             action_count = len(llm_response.get('actions', []))
             print(f"[LLM] Plan: {action_count} steps\n")
-            logger.info("LLM response received")
             return llm_response
         
         except Exception as e:
@@ -404,7 +1072,9 @@ class EnhancedComputerUseAgent:
             api_key = message_data.get('apiKey')
 
             print(f"[MSG] Processing message type: {message_type}")
-            logger.info(f"[MSG] Processing message type: {message_type}")
+
+            if not self._ai_ready.is_set():
+                await self._loop.run_in_executor(None, self._ai_ready.wait)
 
             if not await self.check_internet():
                 print("[MSG] ERROR: No internet connection\n")
@@ -418,9 +1088,9 @@ class EnhancedComputerUseAgent:
                 key = message_data.get('key')
                 print(f"[API] Validating API key...\n")
                 if key and await self.validate_api_key(key):
-                    self.setup_gemini_api()
+                    self.api_key = key
+                    self.model = self._get_model(key)
                     print("[API] API key updated successfully\n")
-                    logger.info("[API] API key updated successfully")
                     return {'type': 'api_key_update', 'success': True}
                 print("[API] ERROR: Invalid API key\n")
                 return {'type': 'api_key_update', 'success': False, 'error': 'Invalid API key'}
@@ -438,8 +1108,7 @@ class EnhancedComputerUseAgent:
                     print(f"[MSG] New API key provided, validating...\n")
                     if await self.validate_api_key(api_key):
                         self.api_key = api_key
-                        genai.configure(api_key=api_key)
-                        self.model = genai.GenerativeModel('gemini-2.0-flash', system_instruction=SYSTEM_PROMPT)
+                        self.model = self._get_model(api_key)
                         print("[MSG] API key updated\n")
                     else:
                         print("[MSG] ERROR: Invalid API key\n")
@@ -452,8 +1121,8 @@ class EnhancedComputerUseAgent:
 
             elif message_type == 'screenshot_request':
                 print("[MSG] Screenshot requested\n")
-                filepath = self.take_screenshot()
-                if filepath:
+                filepath = self.save_screenshot()
+                if filepath and await self.wait_for_screenshot(filepath):
                     return {
                         'type': 'screenshot_result',
                         'success': True,
@@ -485,23 +1154,16 @@ class EnhancedComputerUseAgent:
                 }
 
             print(f"[LLM] Sending to Gemini: {message[:60]}...\n")
-            logger.info(f"[LLM] Sending message to Gemini: {message[:50]}...")
 
             # Create prompt for the enhanced backend
-            prompt = f"""User Request: {message}
-
-Determine if this is a QUESTION or a TASK:
-- QUESTION: Information request, explanation, asking for knowledge
-- TASK: Action request, computer control needed, something to do on the system
-
-Respond with the appropriate JSON format:
-- For QUESTION: {{"type": "question", "response": "Your answer", "requires_action": false}}
-- For TASK: {{"type": "task", "analysis": "...", "plan": "...", "actions": [...]}}"""
+            prompt = REQUEST_PROMPT_PREFIX + message + REQUEST_PROMPT_SUFFIX
 
             # Take initial screenshot for context
-            screenshot_path = self.take_screenshot()
+            screenshot = self.capture_bytes()
             
-            initial_response = self.send_to_llm(prompt, screenshot_path)
+            initial_response = await self.send_to_llm(prompt, screenshot,
+                                                      question_fields=('type', 'response'),
+                                                      stream_answer=True)
 
             if initial_response.get('status') == 'error':
                 print(f"[ERROR] Failed to process request\n")
@@ -523,7 +1185,8 @@ Respond with the appropriate JSON format:
 
             elif request_type == 'task':
                 print(f"[TYPE] Task detected\n")
-                return await self.execute_task_with_enhanced_logic(message, initial_response, screenshot_path)
+                async with self._task_lock:
+                    return await self.execute_task_with_enhanced_logic(message, initial_response, screenshot)
 
             else:
                 print(f"[ERROR] Unknown request type: {request_type}\n")
@@ -540,7 +1203,7 @@ Respond with the appropriate JSON format:
                 'message': str(e),
             }
 
-    async def execute_task_with_enhanced_logic(self, task: str, llm_response: Dict[str, Any], initial_screenshot: str) -> Dict[str, Any]:
+    async def execute_task_with_enhanced_logic(self, task: str, llm_response: Dict[str, Any], initial_screenshot: bytes) -> Dict[str, Any]:
         analysis = llm_response.get('analysis', '')
         plan = llm_response.get('plan', '')
         actions = llm_response.get('actions', [])
@@ -549,7 +1212,9 @@ Respond with the appropriate JSON format:
         print(f"[PLAN] {plan}\n")
         print(f"[EXECUTING] {len(actions)} steps\n")
 
-        step_results = []
+        # One success flag per executed step; details of failures live in
+        # failed_steps
+        step_success = array('b')
         failed_steps = []
         retry_count = 0
         max_retries = 3
@@ -557,30 +1222,40 @@ Respond with the appropriate JSON format:
         while retry_count < max_retries:
             if retry_count == 0:
                 actions_to_execute = actions
-                step_results = []
+                step_success = array('b')
                 failed_steps = []
             else:
                 actions_to_execute = retry_actions
                 print(f"\n[RECOVERY ATTEMPT {retry_count}] Executing alternative plan...\n")
 
-            for i, action in enumerate(actions_to_execute, 1):
-                step_desc = action.get('description', f'Step {i}')
-                print(f"[{i}/{len(actions_to_execute)}] {step_desc}")
-
-                result = self.execute_action(action)
-                step_results.append(result)
-
-                if not result['success']:
-                    failed_steps.append({
-                        'step': i,
-                        'action': result['action'],
-                        'message': result['message']
-                    })
-                    print(f"[FAIL] {result['message']}\n")
-                else:
-                    print(f"[OK]\n")
+            i = 0
+            while i < len(actions_to_execute):
+                # Consecutive terminal steps marked parallel run side by side
+                batch = [actions_to_execute[i]]
+                while (is_parallel_terminal(batch[-1]) and i + len(batch) < len(actions_to_execute)
+                       and is_parallel_terminal(actions_to_execute[i + len(batch)])):
+                    batch.append(actions_to_execute[i + len(batch)])
+
+                for step, action in enumerate(batch, i + 1):
+                    step_desc = action.get('description', f'Step {step}')
+                    print(f"[{step}/{len(actions_to_execute)}] {step_desc}")
+
+                results = await asyncio.gather(*(self._dispatch_action(action) for action in batch))
+
+                for step, result in enumerate(results, i + 1):
+                    step_success.append(result['success'])
+                    if not result['success']:
+                        failed_steps.append({
+                            'step': step,
+                            'action': result['action'],
+                            'message': result['message']
+                        })
+                        print(f"[FAIL] {result['message']}\n")
+                    else:
+                        print(f"[OK]\n")
 
-                time.sleep(0.2)
+                i += len(batch)
+                await asyncio.sleep(ACTION_SETTLE_DELAY.get(str(batch[-1].get('action', '')).lower(), DEFAULT_SETTLE_DELAY))
 
             if not failed_steps:
                 print(f"\n[SUCCESS] All steps completed successfully!\n")
@@ -592,26 +1267,13 @@ Respond with the appropriate JSON format:
                 print(f"{'='*80}\n")
                 print(f"[RECOVERY] {len(failed_steps)} step(s) failed. Trying alternative approach...\n")
 
-                retry_screenshot = self.take_screenshot()
-                retry_info = f"Previous plan failed at steps: {[f['step'] for f in failed_steps]}. Errors: {json.dumps(failed_steps)}"
+                retry_screenshot = await self.capture_bytes_async()
+                retry_info = f"Previous plan failed at steps: {[f['step'] for f in failed_steps]}. Errors: {dump_json(failed_steps)}"
 
-                retry_prompt = f"""Task: {task}
+                retry_prompt = "".join((
+                    "Task: ", task, RETRY_PROMPT_MIDDLE, dump_json(failed_steps, indent=True), RETRY_PROMPT_SUFFIX))
 
-Previous execution had failures. Analyze current screen and create a COMPLETELY DIFFERENT plan.
-Failed steps details:
-{json.dumps(failed_steps, indent=2)}
-
-Try a completely different approach:
-- If you used UI before, try terminal
-- If you used terminal, try UI
-- Change the method/tool used
-- Be more precise with coordinates (calculate perfectly because a wrong coordinate means a wrong click, note you are using pyautogui for the mouse control so understand how it works)
-- Check app window focus before interacting
-
-Create a better plan that avoids these failures using alternative methods.
-Respond ONLY with JSON for a TASK (type: "task")."""
-
-                retry_response = self.send_to_llm(retry_prompt, retry_screenshot, retry_info)
+                retry_response = await self.send_to_llm(retry_prompt, retry_screenshot, retry_info)
 
                 if retry_response.get('status') != 'error' and retry_response.get('type') == 'task':
                     retry_actions = retry_response.get('actions', [])
@@ -626,25 +1288,29 @@ Respond ONLY with JSON for a TASK (type: "task")."""
                 break
 
         # Final verification
-        final_screenshot = self.take_screenshot()
-        
-        completion_prompt = f"""Task was: {task}
-
-Analyze final screenshot and confirm:
-1. Was task completed successfully?
-2. Current system state?
-3. Any issues?
-
-Respond ONLY with JSON:
-{{
-    "type": "question",
-    "response": "Your assessment (this is just for verification)",
-    "completed": true/false,
-    "state": "Your assessment",
-    "status": "success/partial/failed"
-}}"""
-
-        verification = self.send_to_llm(completion_prompt, final_screenshot)
+        final_screenshot = await self.capture_bytes_async()
+        completion_prompt = "".join(("Task was: ", task, VERIFY_PROMPT_SUFFIX))
+
+        # A clean run of the same task that ends on a visually unchanged
+        # screen gets the verdict it got last time instead of another
+        # verification round-trip. Runs with any failed step always ask
+        clean_run = not failed_steps and bool(step_success) and step_success.count(0) == 0
+        shot_hash = image_dhash(final_screenshot) if final_screenshot and clean_run else None
+        verdict_key = (task, step_success.tobytes())
+        cached = self._verdicts.get(verdict_key) if shot_hash is not None else None
+        if cached is not None and cached[0] <= time.monotonic():
+            del self._verdicts[verdict_key]
+            cached = None
+        if cached is not None and (cached[1] ^ shot_hash).bit_count() < DHASH_MAX_DISTANCE:
+            print(f"[VERIFY] Screen unchanged since last check, reusing verdict\n")
+            verification = cached[2]
+        else:
+            verification = await self.send_to_llm(completion_prompt, final_screenshot, use_cache=False)
+            if shot_hash is not None and verification.get('status') != 'error':
+                self._verdicts.pop(verdict_key, None)
+                self._verdicts[verdict_key] = (time.monotonic() + LLM_CACHE_TTL, shot_hash, verification)
+                if len(self._verdicts) > LLM_CACHE_SIZE:
+                    del self._verdicts[next(iter(self._verdicts))]
 
         print(f"[COMPLETION] Completed: {verification.get('completed', False)}")
         print(f"[STATE] {verification.get('state', 'Unknown')}\n")
@@ -652,9 +1318,10 @@ Respond ONLY with JSON:
         print(f"\n{'='*80}")
         print(f" SUMMARY")
         print(f"{'='*80}")
-        print(f"Total Actions: {len(step_results)}")
-        print(f"Successful: {sum(1 for r in step_results if r['success'])}")
-        print(f"Failed: {sum(1 for r in step_results if not r['success'])}")
+        succeeded = step_success.count(1)
+        print(f"Total Actions: {len(step_success)}")
+        print(f"Successful: {succeeded}")
+        print(f"Failed: {len(step_success) - succeeded}")
         print(f"Retry Attempts: {retry_count}")
         print(f"Status: {verification.get('status', 'unknown')}")
         print(f"{'='*80}\n")
@@ -671,46 +1338,91 @@ Respond ONLY with JSON:
                 'message': f"Task could not be completed. Status: {verification.get('status', 'unknown')}",
             }
 
-    def run(self):
-        print("[START] Enhanced Computer Use Agent started - waiting for messages...\n")
-        logger.info("[START] Enhanced Computer Use Agent started")
-
+    def _read_stdin(self, queue: asyncio.Queue) -> None:
+        # Blocking reads live on their own thread so the next message is
+        # taken in while the current one is still being processed. put()
+        # waits when the queue is full, which pauses reading
         try:
-            while self.running:
-                try:
-                    line = input().strip()
-                    if line:
-                        print(f"[INPUT] Received: {line[:80]}...\n")
-                        logger.info(f"[INPUT] Received message")
+            for line in sys.stdin.buffer:
+                asyncio.run_coroutine_threadsafe(queue.put(line), self._loop).result()
+        except Exception as e:
+            logger.error(f"[INPUT] Reader stopped: {e}")
+        finally:
+            asyncio.run_coroutine_threadsafe(queue.put(None), self._loop)
 
-                        message_data = json.loads(line)
-                        result = asyncio.run(self.process_message(message_data))
+    def _changes_api_key(self, message_data: Any) -> bool:
+        if not isinstance(message_data, dict):
+            return False
+        if message_data.get('type') == 'update_api_key':
+            return True
+        api_key = message_data.get('apiKey')
+        return message_data.get('type') == 'user_message' and bool(api_key) and api_key != self.api_key
+
+    async def _handle_message(self, message_data: Any) -> None:
+        async with self._message_sema:
+            current_request_id.set(message_data.get('request_id') if isinstance(message_data, dict) else None)
+            try:
+                result = await self.process_message(message_data)
 
-                        print(f"[OUTPUT] Sending response\n")
-                        logger.info("[OUTPUT] Sending response")
+                print(f"[OUTPUT] Sending response\n")
 
-                        print(json.dumps(result))
-                        sys.stdout.flush()
+                write_message(result)
 
-                except EOFError:
+            except Exception as e:
+                print(f"[LOOP] ERROR: {e}\n")
+                logger.error(f"[LOOP] Error: {e}")
+                write_message({'type': 'error', 'message': str(e)})
+
+    async def _serve(self) -> None:
+        queue = asyncio.Queue(maxsize=MESSAGE_QUEUE_SIZE)
+        threading.Thread(target=self._read_stdin, args=(queue,), name='stdin-reader', daemon=True).start()
+        pending = set()
+        try:
+            while self.running:
+                # Raw bytes straight to the JSON parser; no str decode
+                # and re-encode on the way
+                line = await queue.get()
+                if line is None:
                     print("[STOP] EOF received\n")
                     break
+                line = line.strip()
+                if not line:
+                    continue
+                print(f"[INPUT] Received: {line[:80].decode(errors='replace')}...\n")
+                try:
+                    message_data = load_json(line)
                 except json.JSONDecodeError as e:
                     print(f"[INPUT] ERROR: Invalid JSON: {e}\n")
                     logger.error(f"[INPUT] Invalid JSON: {e}")
-                    print(json.dumps({'type': 'error', 'message': 'Invalid JSON'}))
-                    sys.stdout.flush()
-                except Exception as e:
-                    print(f"[LOOP] ERROR: {e}\n")
-                    logger.error(f"[LOOP] Error: {e}")
-                    print(json.dumps({'type': 'error', 'message': str(e)}))
-                    sys.stdout.flush()
+                    write_message({'type': 'error', 'message': 'Invalid JSON'})
+                    continue
+                if self._changes_api_key(message_data):
+                    # genai.configure swaps the process-wide key, so a key
+                    # change waits for in-flight messages and runs alone
+                    if pending:
+                        await asyncio.gather(*pending, return_exceptions=True)
+                    await self._handle_message(message_data)
+                    continue
+                task = self._loop.create_task(self._handle_message(message_data))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
 
+    def run(self):
+        print("[START] Enhanced Computer Use Agent started - waiting for messages...\n")
+
+        try:
+            self._loop.run_until_complete(self._serve())
         except KeyboardInterrupt:
             print("\n[STOP] Shutting down...\n")
-            logger.info("[STOP] Shutting down...")
         finally:
             self.running = False
+            self.close()
+            # Streams abandoned once their JSON closed still need finalizing
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
 
 if __name__ == "__main__":
     agent = EnhancedComputerUseAgent()
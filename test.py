@@ -4,15 +4,25 @@ Console Test Backend - Control Project
 Enhanced AI agent with precise task execution, error recovery, and adaptive planning
 """
 
+import io
 import sys
 import json
 import time
 import asyncio
 import logging
+import logging.handlers
+import queue
+import atexit
 import os
+import signal
 import subprocess
 import re
+import shlex
+import shutil
+import functools
+import threading
 from pathlib import Path
+from collections import deque
 from typing import Dict, Any, Optional
 from datetime import datetime
 
@@ -20,7 +30,6 @@ project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 if sys.platform == 'win32':
-    import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
@@ -36,6 +45,10 @@ try:
         pyperclip = None
     from PIL import Image
     import google.generativeai as genai
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
     
     try:
         import pyautogui
@@ -51,16 +64,42 @@ except ImportError as e:
 
 load_dotenv()
 
+# Handlers run on a listener thread; log calls on the hot path only enqueue
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - [CONTROL] - %(message)s')
+log_queue = queue.Queue(-1)
+# control.log is opened on the first flush and written in batches; errors
+# (and shutdown) flush right away
+log_file_handler = logging.FileHandler('control.log', delay=True)
+log_handlers = [logging.StreamHandler(sys.stdout), log_file_handler]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_handlers[1] = logging.handlers.MemoryHandler(100, flushLevel=logging.ERROR, target=log_file_handler)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - [CONTROL] - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('control.log')
-    ]
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(message)s',
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+MAX_UPLOAD_EDGE = 1536
+
+# Commands that need cmd.exe/sh even though they look like a plain program call
+SHELL_BUILTINS = {
+    'cd', 'chdir', 'dir', 'echo', 'set', 'export', 'source', 'alias', 'type', 'copy', 'move',
+    'del', 'erase', 'ren', 'rename', 'md', 'mkdir', 'rd', 'rmdir', 'start', 'call', 'cls',
+    'pushd', 'popd', 'exit', 'mklink', 'assoc', 'ftype', 'title', 'ver', 'vol',
+}
+SHELL_METACHARS = frozenset('|&;<>()$`*?~%^!\n')
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+SELF_CHECKING_ACTIONS = {'terminal', 'wait'}
+
+JSON_FENCE_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+JSON_DECODER = json.JSONDecoder()
+
 SYSTEM_PROMPT = """You are Control, an intelligent AI assistant with full access to a user's laptop. You can interact with it exactly like a human would.
 
 **YOUR CAPABILITIES:**
@@ -127,7 +166,7 @@ SYSTEM_PROMPT = """You are Control, an intelligent AI assistant with full access
 5. scroll - Scroll in app. params: {"coordinates": [x, y], "direction": "up|down", "amount": 3}
 6. type - Type text (focus field first!). params: {"text": "hello", "clear_first": false}
 7. key_press - Keyboard shortcuts. params: {"keys": ["ctrl", "a"], "combo": true}
-8. terminal - System command. params: {"command": "command"}
+8. terminal - System command. params: {"command": "command", "parallel": false} - set parallel true on consecutive commands that don't depend on each other to run them together
 9. wait - Pause for app response. params: {"duration": 1}
 10. focus_window - Switch to app. params: {"app_name": "Chrome", "method": "alt_tab|search|terminal"}
 11. find_and_click - Smart click (use when uncertain). params: {"search_text": "text on screen", "action": "click|double_click"}
@@ -155,6 +194,8 @@ SYSTEM_PROMPT = """You are Control, an intelligent AI assistant with full access
 - If window doesn't focus: Use alternative focus method
 - If coordinate seems off: Take screenshot and recalculate center point
 - Don't give up on first failure - adjust and retry
+- On a retry request: failed clicks were likely 5-10px off the visual center, failed typing means the field wasn't focused, and an unresponsive app means focus or timing - re-examine the new screenshot, add safety margins, increase waits
+- If the same method keeps failing, switch approach entirely: keyboard shortcuts or terminal commands instead of clicking
 
 **RULES:**
 - First determine if request is QUESTION or TASK
@@ -167,14 +208,107 @@ SYSTEM_PROMPT = """You are Control, an intelligent AI assistant with full access
 - Speed is good, but accuracy is CRITICAL
 - Log failed clicks with corrective adjustments"""
 
+@functools.lru_cache(maxsize=128)
+def resolve_executable(name: str) -> Optional[str]:
+    return shutil.which(name)
+
+def split_command(command: str) -> Optional[list]:
+    # argv for running without a shell, or None when a shell is required
+    if not command or SHELL_METACHARS.intersection(command):
+        return None
+    try:
+        argv = shlex.split(command, posix=(os.name != 'nt'))
+    except ValueError:
+        return None
+    if os.name == 'nt':
+        argv = [arg[1:-1] if len(arg) > 1 and arg[0] == arg[-1] == '"' else arg for arg in argv]
+    if not argv or argv[0].lower() in SHELL_BUILTINS:
+        return None
+    executable = resolve_executable(argv[0])
+    if executable is None:
+        return None
+    return [executable] + argv[1:]
+
+async def kill_process(proc) -> None:
+    # On POSIX commands run in their own session, so the whole group goes:
+    # a shell's children hold the output pipes too, and wait() only returns
+    # once those close. Elsewhere only the direct child can be killed, so
+    # the wait for it is bounded
+    if os.name != 'nt':
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        proc.kill()
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=1)
+    except asyncio.TimeoutError:
+        pass
+
+def parse_llm_json(response_text: str) -> Dict[str, Any]:
+    fence = JSON_FENCE_RE.search(response_text)
+    if fence:
+        json_str = fence.group(1)
+        return orjson.loads(json_str) if orjson is not None else json.loads(json_str)
+    start = response_text.find('{')
+    if start < 0:
+        raise ValueError("No JSON found")
+    # raw_decode stops at the end of the first object, so trailing prose is
+    # ignored without scanning for the matching brace first
+    return JSON_DECODER.raw_decode(response_text, start)[0]
+
+def requires_gui(handler):
+    @functools.wraps(handler)
+    def wrapper(self, params, result):
+        if not (GUI_AVAILABLE and pyautogui):
+            result["message"] = "GUI control not available"
+            return
+        handler(self, params, result)
+    return wrapper
+
+def summarize_result(result: Dict[str, Any], action: Dict[str, Any]) -> Dict[str, Any]:
+    summary = {"success": result['success'], "action": result['action'], "message": result['message'][:80]}
+    if not result['success']:
+        summary["parameters"] = action.get('parameters', {})
+    return summary
+
+def is_parallel_terminal(action: Dict[str, Any]) -> bool:
+    return (str(action.get('action', '')).lower() == 'terminal'
+            and bool((action.get('parameters') or {}).get('parallel')))
+
 class ConsoleTestBackend:
     
     def __init__(self):
         self.running = True
         self.screenshot_dir = project_root / "screenshots"
         self.screenshot_dir.mkdir(exist_ok=True)
-        self.execution_history = []
+        # Bounded session log of summarized steps; full failure details only
+        # live in the task's own failed_steps list
+        self.execution_history = deque(maxlen=200)
         self.last_screenshot = None
+        self._sct = None
+        self._monitor = None
+        self._dxcam = None
+        self._last_frame = None
+        self.upload_scale = 1.0
+        self._origin = (0, 0)
+        # Per-action detail lines are collected and written once per task
+        # unless CONTROL_VERBOSE asks for them as they happen
+        self.verbose = bool(os.getenv('CONTROL_VERBOSE'))
+        self._log_buffer = []
+        self._dispatch = {
+            'screenshot': self._act_screenshot,
+            'click': self._act_click,
+            'double_click': self._act_double_click,
+            'mouse_move': self._act_mouse_move,
+            'scroll': self._act_scroll,
+            'type': self._act_type,
+            'key_press': self._act_key_press,
+            'wait': self._act_wait,
+            'focus_window': self._act_focus_window,
+            'find_and_click': self._act_find_and_click,
+        }
         
         self.setup_gemini_api()
         self.setup_computer_control()
@@ -193,46 +327,141 @@ class ConsoleTestBackend:
                                              system_instruction=SYSTEM_PROMPT)
             print("[API] Ready\n")
             logger.info("API configured")
+            if api_key != "test_api_key":
+                threading.Thread(target=self._warm_up_model, daemon=True).start()
         except Exception as e:
             print(f"[API] ERROR: {e}\n")
             self.model = None
     
+    def _warm_up_model(self) -> None:
+        # Opens the API channel while the user is still typing, so the first
+        # request doesn't pay for the handshake. count_tokens is free, unlike
+        # a throwaway generate_content call
+        try:
+            self.model.count_tokens("ping", request_options={"timeout": 5})
+        except Exception as e:
+            logger.info(f"Model warm-up skipped: {e}")
+    
     def setup_computer_control(self):
         try:
             if GUI_AVAILABLE and pyautogui:
                 pyautogui.FAILSAFE = True
-                pyautogui.PAUSE = 0.1  # Increased from 0.05 for reliability
+                pyautogui.PAUSE = 0.02
                 print("[CONTROL] GUI libraries ready\n")
             
             try:
-                with mss.mss() as sct:
-                    monitors = sct.monitors
-                    print(f"[CONTROL] {len(monitors)-1} monitor(s) detected\n")
+                # One capture handle for the whole session instead of
+                # reallocating device contexts on every screenshot
+                self._sct = mss.mss()
+                monitors = self._sct.monitors
+                self._monitor = monitors[1]
+                self._origin = (self._monitor['left'], self._monitor['top'])
+                print(f"[CONTROL] {len(monitors)-1} monitor(s) detected\n")
             except Exception as e:
                 print(f"[CONTROL] WARNING: {e}\n")
+            
+            # DXGI Desktop Duplication is much faster than GDI BitBlt on
+            # Windows; mss stays as the fallback everywhere else
+            if sys.platform == 'win32':
+                try:
+                    import dxcam
+                    self._dxcam = dxcam.create(output_color="BGRA")
+                    print("[CONTROL] DXcam capture enabled\n")
+                except Exception as e:
+                    logger.info(f"DXcam unavailable, using mss: {e}")
         except Exception as e:
             print(f"[CONTROL] ERROR: {e}\n")
     
+    def close(self) -> None:
+        if self._dxcam is not None:
+            self._dxcam.release()
+            self._dxcam = None
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    def grab_screen(self):
+        # Returns the raw BGRA frame and its size; conversion is left to the
+        # encoder
+        if self._dxcam is not None:
+            frame = self._dxcam.grab()
+            # grab() returns None when nothing changed since the last frame
+            if frame is not None:
+                height, width = frame.shape[:2]
+                self._last_frame = (frame, (width, height))
+            if self._last_frame is not None:
+                return self._last_frame
+        if self._sct is None:
+            raise RuntimeError("Screen capture not available")
+        sct_img = self._sct.grab(self._monitor)
+        return sct_img.bgra, sct_img.size
+    
+    def take_screenshot_bytes(self) -> bytes:
+        # In-memory JPEG for the model, so the LLM path never writes a PNG
+        # just to read it back
+        try:
+            bgra, size = self.grab_screen()
+            img = Image.frombuffer("RGB", size, bgra, "raw", "BGRX", 0, 1)
+            # The model tiles and downsamples large frames anyway; capping the
+            # long edge cuts upload size and image tokens. Model coordinates
+            # are mapped back to screen pixels with upload_scale
+            self.upload_scale = min(1.0, MAX_UPLOAD_EDGE / max(size))
+            if self.upload_scale < 1:
+                img = img.resize((round(size[0] * self.upload_scale), round(size[1] * self.upload_scale)),
+                                 Image.Resampling.BILINEAR)
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=75, optimize=False)
+            return buf.getvalue()
+        
+        except Exception as e:
+            logger.error(f"Screenshot error: {e}")
+            return b""
+    
     def take_screenshot(self) -> str:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
             filename = f"screenshot_{timestamp}.png"
             filepath = self.screenshot_dir / filename
             
-            with mss.mss() as sct:
-                monitor = sct.monitors[1]
-                sct_img = sct.grab(monitor)
-                img = Image.frombytes("RGB", sct_img.size, sct_img.rgb)
-                img.save(filepath)
+            bgra, size = self.grab_screen()
+            # frombuffer reads the BGRA frame in place instead of going
+            # through the repacked .rgb copy
+            img = Image.frombuffer("RGB", size, bgra, "raw", "BGRX", 0, 1)
+            img.save(filepath, compress_level=1)
             
             self.last_screenshot = str(filepath)
-            logger.info(f"Screenshot saved: {filepath}")
+            logger.debug("Screenshot saved: %s", filepath)
             return str(filepath)
         
         except Exception as e:
             logger.error(f"Screenshot error: {e}")
             return ""
     
+    def _log_action(self, line: str) -> None:
+        if self.verbose:
+            print(f"{line}\n")
+        else:
+            self._log_buffer.append(line)
+    
+    def _flush_action_log(self) -> None:
+        if self._log_buffer:
+            lines, self._log_buffer = self._log_buffer, []
+            sys.stdout.write("[ACTIONS]\n" + "\n".join(lines) + "\n\n")
+    
+    def _to_screen(self, coordinates) -> tuple:
+        # The model sees the downscaled upload of monitor 1, so its
+        # coordinates are in that image's pixels; the monitor's position on
+        # the virtual desktop turns them into pyautogui coordinates
+        x, y = coordinates
+        return (self._origin[0] + round(x / self.upload_scale),
+                self._origin[1] + round(y / self.upload_scale))
+    
     def execute_action(self, action: Dict[str, Any]) -> Dict[str, Any]:
         result = {"success": False, "message": "", "action": action.get('action')}
         
@@ -240,152 +469,9 @@ class ConsoleTestBackend:
             action_type = action.get('action', '').lower()
             params = action.get('parameters', {})
             
-            if action_type == 'screenshot':
-                filepath = self.take_screenshot()
-                result["success"] = bool(filepath)
-                result["message"] = filepath
-                print(f"[SCREENSHOT] Captured\n")
-            
-            elif action_type == 'click':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    note = params.get('note', '')
-                    pyautogui.click(x, y)
-                    time.sleep(0.3)  # Wait for UI response
-                    result["success"] = True
-                    result["message"] = f"Clicked ({x}, {y}) {note}"
-                    print(f"[CLICK] ({x}, {y}) - Center click {note}\n")
-            
-            elif action_type == 'double_click':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.click(x, y, clicks=2, interval=0.1)
-                    time.sleep(0.3)
-                    result["success"] = True
-                    result["message"] = f"Double-clicked ({x}, {y})"
-                    print(f"[DOUBLE_CLICK] ({x}, {y})\n")
-            
-            elif action_type == 'mouse_move':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [0, 0])
-                    pyautogui.moveTo(x, y, duration=0.5)
-                    result["success"] = True
-                    result["message"] = f"Moved to ({x}, {y})"
-                    print(f"[MOUSE_MOVE] ({x}, {y})\n")
-            
-            elif action_type == 'scroll':
-                if GUI_AVAILABLE and pyautogui:
-                    x, y = params.get('coordinates', [500, 500])
-                    direction = params.get('direction', 'down')
-                    amount = params.get('amount', 3)
-                    scroll_amount = amount if direction == 'down' else -amount
-                    pyautogui.moveTo(x, y, duration=0.3)
-                    time.sleep(0.2)
-                    pyautogui.scroll(scroll_amount)
-                    time.sleep(0.3)
-                    result["success"] = True
-                    result["message"] = f"Scrolled {direction} by {amount}"
-                    print(f"[SCROLL] {direction} x{amount}\n")
-            
-            elif action_type == 'type':
-                if GUI_AVAILABLE and pyautogui:
-                    text = params.get('text', '')
-                    clear_first = params.get('clear_first', False)
-                    if clear_first:
-                        pyautogui.hotkey('ctrl', 'a')
-                        time.sleep(0.15)
-                        pyautogui.press('delete')
-                        time.sleep(0.15)
-                    time.sleep(0.2)  # Ensure field is ready
-                    pyautogui.write(text, interval=0.05)  # Slower typing
-                    time.sleep(0.3)
-                    result["success"] = True
-                    result["message"] = f"Typed: {text[:30]}"
-                    print(f"[TYPE] {text[:30]}\n")
-            
-            elif action_type == 'key_press':
-                if GUI_AVAILABLE and pyautogui:
-                    keys = params.get('keys', [])
-                    combo = params.get('combo', len(keys) > 1)
-                    if combo and len(keys) > 1:
-                        pyautogui.hotkey(*keys)
-                    else:
-                        for key in keys:
-                            pyautogui.press(key)
-                            time.sleep(0.1)
-                    time.sleep(0.3)
-                    result["success"] = True
-                    result["message"] = f"Keys: {'+'.join(keys)}"
-                    print(f"[KEY_PRESS] {'+'.join(keys)}\n")
-            
-            elif action_type == 'terminal':
-                command = params.get('command', '')
-                try:
-                    output = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=10)
-                    result["success"] = output.returncode == 0
-                    result["message"] = output.stdout[:200] if output.stdout else output.stderr[:200]
-                    print(f"[TERMINAL] {command}\n")
-                except Exception as e:
-                    result["message"] = str(e)
-            
-            elif action_type == 'wait':
-                duration = params.get('duration', 1)
-                time.sleep(duration)
-                result["success"] = True
-                result["message"] = f"Waited {duration}s"
-                print(f"[WAIT] {duration}s\n")
-            
-            elif action_type == 'focus_window':
-                if GUI_AVAILABLE and pyautogui:
-                    app_name = params.get('app_name', '')
-                    method = params.get('method', 'search')
-                    
-                    if method == 'alt_tab':
-                        pyautogui.hotkey('alt', 'tab')
-                        time.sleep(0.5)
-                        result["success"] = True
-                        result["message"] = f"Alt+Tab to switch window"
-                        print(f"[FOCUS_WINDOW] Alt+Tab\n")
-                    
-                    elif method == 'search':
-                        # Windows search or Mac spotlight
-                        if sys.platform == 'win32':
-                            pyautogui.hotkey('win')
-                        else:
-                            pyautogui.hotkey('cmd', 'space')
-                        time.sleep(0.5)
-                        pyautogui.write(app_name, interval=0.05)
-                        time.sleep(0.5)
-                        pyautogui.press('enter')
-                        time.sleep(1)
-                        result["success"] = True
-                        result["message"] = f"Opened/focused {app_name}"
-                        print(f"[FOCUS_WINDOW] Searching for {app_name}\n")
-                    
-                    elif method == 'terminal':
-                        # Use terminal to launch app
-                        if sys.platform == 'win32':
-                            cmd = f'start "" "{app_name}"'
-                        else:
-                            cmd = f'open -a "{app_name}"'
-                        subprocess.Popen(cmd, shell=True)
-                        time.sleep(1)
-                        result["success"] = True
-                        result["message"] = f"Launched {app_name} via terminal"
-                        print(f"[FOCUS_WINDOW] Terminal launch {app_name}\n")
-                    
-                    else:
-                        result["message"] = f"Unknown focus method: {method}"
-            
-            elif action_type == 'find_and_click':
-                if GUI_AVAILABLE and pyautogui:
-                    search_text = params.get('search_text', '')
-                    click_action = params.get('action', 'click')
-                    
-                    # Note: This is a placeholder - real implementation would use OCR
-                    result["message"] = f"Smart click requested for '{search_text}' - requires OCR implementation"
-                    print(f"[FIND_AND_CLICK] Placeholder - OCR needed for '{search_text}'\n")
-            
+            handler = self._dispatch.get(action_type)
+            if handler:
+                handler(params, result)
             else:
                 result["message"] = f"Unknown action: {action_type}"
         
@@ -396,7 +482,189 @@ class ConsoleTestBackend:
         
         return result
     
-    def send_to_llm(self, prompt: str, screenshot_path: str = None, retry_info: str = None) -> Dict[str, Any]:
+    def _act_screenshot(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        filepath = self.take_screenshot()
+        result["success"] = bool(filepath)
+        result["message"] = filepath
+        self._log_action(f"[SCREENSHOT] Captured")
+    
+    @requires_gui
+    def _act_click(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        note = params.get('note', '')
+        pyautogui.click(x, y)
+        time.sleep(0.3)  # Wait for UI response
+        result["success"] = True
+        result["message"] = f"Clicked ({x}, {y}) {note}"
+        self._log_action(f"[CLICK] ({x}, {y}) - Center click {note}")
+    
+    @requires_gui
+    def _act_double_click(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        pyautogui.click(x, y, clicks=2, interval=0.1)
+        time.sleep(0.3)
+        result["success"] = True
+        result["message"] = f"Double-clicked ({x}, {y})"
+        self._log_action(f"[DOUBLE_CLICK] ({x}, {y})")
+    
+    @requires_gui
+    def _act_mouse_move(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [0, 0]))
+        pyautogui.moveTo(x, y, duration=0.5)
+        result["success"] = True
+        result["message"] = f"Moved to ({x}, {y})"
+        self._log_action(f"[MOUSE_MOVE] ({x}, {y})")
+    
+    @requires_gui
+    def _act_scroll(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        x, y = self._to_screen(params.get('coordinates', [500, 500]))
+        direction = params.get('direction', 'down')
+        amount = params.get('amount', 3)
+        scroll_amount = -amount if direction == 'down' else amount
+        pyautogui.moveTo(x, y, duration=0.3)
+        time.sleep(0.2)
+        pyautogui.scroll(scroll_amount)
+        time.sleep(0.3)
+        result["success"] = True
+        result["message"] = f"Scrolled {direction} by {amount}"
+        self._log_action(f"[SCROLL] {direction} x{amount}")
+    
+    @requires_gui
+    def _act_type(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        text = params.get('text', '')
+        clear_first = params.get('clear_first', False)
+        if clear_first:
+            pyautogui.hotkey('ctrl', 'a')
+            time.sleep(0.15)
+            pyautogui.press('delete')
+            time.sleep(0.15)
+        time.sleep(0.2)  # Ensure field is ready
+        if pyperclip and len(text) > 20 and '\t' not in text:
+            # One paste instead of 50 ms per character. A trailing
+            # newline is pressed rather than pasted so it still
+            # submits single-line fields
+            body = text.rstrip('\n')
+            if body:
+                pyperclip.copy(body)
+                pyautogui.hotkey('command' if sys.platform == 'darwin' else 'ctrl', 'v')
+            for _ in range(len(text) - len(body)):
+                pyautogui.press('enter')
+        else:
+            pyautogui.write(text, interval=0.02)
+        time.sleep(0.3)
+        result["success"] = True
+        result["message"] = f"Typed: {text[:30]}"
+        self._log_action(f"[TYPE] {text[:30]}")
+    
+    @requires_gui
+    def _act_key_press(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        keys = params.get('keys', [])
+        combo = params.get('combo', len(keys) > 1)
+        if combo and len(keys) > 1:
+            pyautogui.hotkey(*keys)
+        else:
+            for key in keys:
+                pyautogui.press(key)
+                time.sleep(0.1)
+        time.sleep(0.3)
+        result["success"] = True
+        result["message"] = f"Keys: {'+'.join(keys)}"
+        self._log_action(f"[KEY_PRESS] {'+'.join(keys)}")
+    
+    def _act_wait(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        duration = params.get('duration', 1)
+        time.sleep(duration)
+        result["success"] = True
+        result["message"] = f"Waited {duration}s"
+        self._log_action(f"[WAIT] {duration}s")
+    
+    @requires_gui
+    def _act_focus_window(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        app_name = params.get('app_name', '')
+        method = params.get('method', 'search')
+        
+        if method == 'alt_tab':
+            pyautogui.hotkey('alt', 'tab')
+            time.sleep(0.5)
+            result["success"] = True
+            result["message"] = f"Alt+Tab to switch window"
+            self._log_action(f"[FOCUS_WINDOW] Alt+Tab")
+        
+        elif method == 'search':
+            # Windows search or Mac spotlight
+            if sys.platform == 'win32':
+                pyautogui.hotkey('win')
+            else:
+                pyautogui.hotkey('cmd', 'space')
+            time.sleep(0.5)
+            pyautogui.write(app_name, interval=0.05)
+            time.sleep(0.5)
+            pyautogui.press('enter')
+            time.sleep(1)
+            result["success"] = True
+            result["message"] = f"Opened/focused {app_name}"
+            self._log_action(f"[FOCUS_WINDOW] Searching for {app_name}")
+        
+        elif method == 'terminal':
+            # Use terminal to launch app
+            if sys.platform == 'win32':
+                cmd = f'start "" "{app_name}"'
+            else:
+                cmd = f'open -a "{app_name}"'
+            subprocess.Popen(cmd, shell=True)
+            time.sleep(1)
+            result["success"] = True
+            result["message"] = f"Launched {app_name} via terminal"
+            self._log_action(f"[FOCUS_WINDOW] Terminal launch {app_name}")
+        
+        else:
+            result["message"] = f"Unknown focus method: {method}"
+    
+    @requires_gui
+    def _act_find_and_click(self, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        search_text = params.get('search_text', '')
+        click_action = params.get('action', 'click')
+        
+        # Note: This is a placeholder - real implementation would use OCR
+        result["message"] = f"Smart click requested for '{search_text}' - requires OCR implementation"
+        self._log_action(f"[FIND_AND_CLICK] Placeholder - OCR needed for '{search_text}'")
+    
+    async def run_terminal(self, action: Dict[str, Any]) -> Dict[str, Any]:
+        # Runs on the event loop, so a parallel batch waits on its commands
+        # together instead of blocking for up to the timeout each
+        result = {"success": False, "message": "", "action": action.get('action')}
+        command = (action.get('parameters') or {}).get('command', '')
+        try:
+            # Plain "program args" commands skip the extra shell process
+            argv = split_command(command)
+            if argv is None:
+                proc = await asyncio.create_subprocess_shell(
+                    command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    creationflags=CREATE_NO_WINDOW, start_new_session=(os.name != 'nt'))
+            else:
+                proc = await asyncio.create_subprocess_exec(
+                    *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    creationflags=CREATE_NO_WINDOW, start_new_session=(os.name != 'nt'))
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=10)
+            except asyncio.TimeoutError:
+                await kill_process(proc)
+                raise TimeoutError(f"Command '{command}' timed out after 10 seconds")
+            stdout = stdout.decode(errors='replace')
+            stderr = stderr.decode(errors='replace')
+            result["success"] = proc.returncode == 0
+            result["message"] = stdout[:200] if stdout else stderr[:200]
+            self._log_action(f"[TERMINAL] {command}")
+        except Exception as e:
+            result["message"] = str(e)
+        return result
+    
+    async def _dispatch_action(self, action: Dict[str, Any]) -> Dict[str, Any]:
+        if str(action.get('action', '')).lower() == 'terminal':
+            return await self.run_terminal(action)
+        return self.execute_action(action)
+    
+    def send_to_llm(self, prompt: str, screenshot: bytes = None) -> Dict[str, Any]:
         try:
             if not self.model:
                 return {"status": "error", "actions": []}
@@ -405,34 +673,19 @@ class ConsoleTestBackend:
             
             content_parts = [prompt]
             
-            if retry_info:
-                content_parts.insert(0, f"CRITICAL RETRY NOTICE:\n{retry_info}\n\nANALYZE THE FAILURE AND ADJUST YOUR COORDINATE CALCULATIONS. Check visual centers of UI elements more carefully.")
-            
-            if screenshot_path and os.path.exists(screenshot_path):
-                with open(screenshot_path, 'rb') as f:
-                    image_data = f.read()
+            if screenshot:
                 content_parts.append({
-                    "mime_type": "image/png",
-                    "data": image_data
+                    "mime_type": "image/jpeg",
+                    "data": screenshot
                 })
             
             response = self.model.generate_content(content_parts)
             response_text = response.text.strip()
             
-            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group()
-                else:
-                    raise ValueError("No JSON found")
-            
-            llm_response = json.loads(json_str)
+            llm_response = parse_llm_json(response_text)
             action_count = len(llm_response.get('actions', []))
             print(f"[LLM] Plan: {action_count} steps\n")
-            logger.info("LLM response received")
+            logger.debug("LLM response received")
             return llm_response
         
         except Exception as e:
@@ -440,32 +693,21 @@ class ConsoleTestBackend:
             logger.error(f"LLM error: {e}")
             return {"status": "error", "actions": []}
     
-    def execute_task(self, user_request: str) -> None:
+    async def execute_task(self, user_request: str) -> None:
         print(f"\n{'='*80}")
         print(f" REQUEST: {user_request}")
         print(f"{'='*80}\n")
         
-        screenshot_path = self.take_screenshot()
-        if not screenshot_path:
+        screenshot = self.take_screenshot_bytes()
+        if not screenshot:
             print("[ERROR] Cannot capture initial screenshot\n")
             return
         
-        prompt = f"""User Request: {user_request}
-
-You have FULL ACCESS to this user's computer. Determine if this is a QUESTION or a TASK:
-- QUESTION: Information request, explanation, asking for knowledge
-- TASK: Action request, computer control needed, something to do on the system
-
-Respond with the appropriate JSON format. If TASK, remember:
-- You're using PyAutoGUI which has 5-15px coordinate offset potential
-- ALWAYS click center of buttons/elements, not edges
-- Take screenshot before major actions
-- Ensure window focus before clicking
-- Use terminal for system-level operations
-
-Respond ONLY with valid JSON."""
+        # Request classification and the clicking/focus rules live in
+        # SYSTEM_PROMPT, which the model already carries on every call
+        prompt = f"User Request: {user_request}\n\nRespond ONLY with valid JSON."
         
-        initial_response = self.send_to_llm(prompt, screenshot_path)
+        initial_response = self.send_to_llm(prompt, screenshot)
         
         if initial_response.get('status') == 'error':
             print(f"[ERROR] Failed to process request\n")
@@ -482,12 +724,12 @@ Respond ONLY with valid JSON."""
         
         elif request_type == 'task':
             print(f"[TYPE] Task detected\n")
-            self._execute_task_actions(user_request, initial_response, screenshot_path)
+            await self._execute_task_actions(user_request, initial_response)
         
         else:
             print(f"[ERROR] Unknown request type: {request_type}\n")
     
-    def _execute_task_actions(self, task: str, llm_response: Dict[str, Any], initial_screenshot: str) -> None:
+    async def _execute_task_actions(self, task: str, llm_response: Dict[str, Any]) -> None:
         analysis = llm_response.get('analysis', '')
         plan = llm_response.get('plan', '')
         actions = llm_response.get('actions', [])
@@ -510,25 +752,40 @@ Respond ONLY with valid JSON."""
                 actions_to_execute = retry_actions
                 print(f"\n[RECOVERY ATTEMPT {retry_count}] Analyzing failure and adjusting approach...\n")
             
-            for i, action in enumerate(actions_to_execute, 1):
-                step_desc = action.get('description', f'Step {i}')
-                print(f"[{i}/{len(actions_to_execute)}] {step_desc}")
+            i = 0
+            while i < len(actions_to_execute):
+                # Consecutive terminal steps marked parallel run side by side
+                batch = [actions_to_execute[i]]
+                while (is_parallel_terminal(batch[-1]) and i + len(batch) < len(actions_to_execute)
+                       and is_parallel_terminal(actions_to_execute[i + len(batch)])):
+                    batch.append(actions_to_execute[i + len(batch)])
                 
-                result = self.execute_action(action)
-                step_results.append(result)
+                for step, action in enumerate(batch, i + 1):
+                    step_desc = action.get('description', f'Step {step}')
+                    print(f"[{step}/{len(actions_to_execute)}] {step_desc}")
                 
-                if not result['success']:
-                    failed_steps.append({
-                        'step': i,
-                        'action': result['action'],
-                        'message': result['message'],
-                        'parameters': action.get('parameters', {})
-                    })
-                    print(f"[FAIL] {result['message']}\n")
-                else:
-                    print(f"[OK]\n")
+                # Detail lines belong between the step header and its result
+                try:
+                    results = await asyncio.gather(*(self._dispatch_action(action) for action in batch))
+                finally:
+                    self._flush_action_log()
+                
+                for step, (action, result) in enumerate(zip(batch, results), i + 1):
+                    step_results.append(result)
+                    self.execution_history.append(summarize_result(result, action))
+                    if not result['success']:
+                        failed_steps.append({
+                            'step': step,
+                            'action': result['action'],
+                            'message': result['message'],
+                            'parameters': action.get('parameters', {})
+                        })
+                        print(f"[FAIL] {result['message']}\n")
+                    else:
+                        print(f"[OK]\n")
                 
-                time.sleep(0.3)
+                i += len(batch)
+                await asyncio.sleep(0.3)
             
             if not failed_steps:
                 print(f"\n[SUCCESS] All steps completed successfully!\n")
@@ -543,7 +800,7 @@ Respond ONLY with valid JSON."""
                     print(f"  Step {failure['step']}: {failure['action']} - {failure['message']}")
                 print()
                 
-                retry_screenshot = self.take_screenshot()
+                retry_screenshot = self.take_screenshot_bytes()
                 
                 # Build detailed failure context
                 failure_details = "\n".join([
@@ -552,38 +809,16 @@ Respond ONLY with valid JSON."""
                     for f in failed_steps
                 ])
                 
-                retry_info = f"""PREVIOUS FAILURES:
-{failure_details}
-
-CRITICAL OBSERVATIONS:
-1. If clicks failed: Coordinates were likely off by 5-10px from visual center
-2. If typing failed: Field may not have been properly focused
-3. If app didn't respond: Window focus or timing issue
-
-ACTION ITEMS:
-- Re-examine visual centers of UI elements in screenshot
-- Add 5-10px safety margins from button edges
-- Increase wait times if apps are slow
-- Verify window is in focus before interactions
-- Try COMPLETELY DIFFERENT approach if current method failing consistently
-
-Current screenshot shows actual UI state. Recalculate all coordinates carefully."""
-
+                # Only the failures are new; the recovery rules are in SYSTEM_PROMPT
                 retry_prompt = f"""Task: {task}
 
-Previous execution had {len(failed_steps)} failure(s). You are looking at updated screenshot.
+RETRY: the previous attempt had {len(failed_steps)} failure(s). The screenshot shows the current state.
 
-{retry_info}
-
-Try a COMPLETELY DIFFERENT and more reliable approach:
-- If you used UI clicking before, try keyboard shortcuts or terminal commands
-- If coordinates seemed off: Click more precisely at visual center (not edge)
-- If app didn't respond: Increase wait times or try alternative focus method
-- Use terminal when possible for reliability
+{failure_details}
 
 Respond ONLY with valid JSON for a TASK (type: "task")."""
                 
-                retry_response = self.send_to_llm(retry_prompt, retry_screenshot, retry_info)
+                retry_response = self.send_to_llm(retry_prompt, retry_screenshot)
                 
                 if retry_response.get('status') != 'error' and retry_response.get('type') == 'task':
                     retry_actions = retry_response.get('actions', [])
@@ -597,7 +832,40 @@ Respond ONLY with valid JSON for a TASK (type: "task")."""
                 print(f"\n[ERROR] Max retry attempts ({max_retries}) reached. Task may not be completable.\n")
                 break
         
-        final_screenshot = self.take_screenshot()
+        # Terminal steps report their own exit status, so a clean run made up
+        # only of terminal and wait steps needs no screenshot round-trip
+        if not failed_steps and step_results and all(
+                str(r['action']).lower() in SELF_CHECKING_ACTIONS for r in step_results):
+            print(f"[COMPLETION] Every step confirmed by its result, skipping screen check\n")
+            verification = {"completed": True, "state": "All steps succeeded", "status": "success"}
+        else:
+            verification = self._verify_completion(task)
+        
+        print(f"[COMPLETION] Completed: {verification.get('completed', False)}")
+        print(f"[STATE] {verification.get('state', 'Unknown')}\n")
+        
+        print(f"\n{'='*80}")
+        print(f" EXECUTION SUMMARY")
+        print(f"{'='*80}")
+        print(f"Total Actions: {len(step_results)}")
+        print(f"Successful: {sum(1 for r in step_results if r['success'])}")
+        print(f"Failed: {sum(1 for r in step_results if not r['success'])}")
+        print(f"Retry Attempts: {retry_count}")
+        print(f"Status: {verification.get('status', 'unknown')}")
+        if len(step_results) > 0:
+            success_rate = (sum(1 for r in step_results if r['success']) / len(step_results)) * 100
+            print(f"Success Rate: {success_rate:.1f}%")
+        print(f"{'='*80}\n")
+        logger.info("Task summary: %s", json.dumps({
+            "task": task[:80],
+            "actions": len(step_results),
+            "failed": sum(1 for r in step_results if not r['success']),
+            "retries": retry_count,
+            "status": verification.get('status', 'unknown')
+        }))
+    
+    def _verify_completion(self, task: str) -> Dict[str, Any]:
+        final_screenshot = self.take_screenshot_bytes()
         
         print(f"\n{'='*80}")
         print(f" COMPLETION VERIFICATION")
@@ -619,25 +887,9 @@ Respond ONLY with JSON:
   "status": "success/partial/failed"
 }}"""
         
-        verification = self.send_to_llm(completion_prompt, final_screenshot)
-        
-        print(f"[COMPLETION] Completed: {verification.get('completed', False)}")
-        print(f"[STATE] {verification.get('state', 'Unknown')}\n")
-        
-        print(f"\n{'='*80}")
-        print(f" EXECUTION SUMMARY")
-        print(f"{'='*80}")
-        print(f"Total Actions: {len(step_results)}")
-        print(f"Successful: {sum(1 for r in step_results if r['success'])}")
-        print(f"Failed: {sum(1 for r in step_results if not r['success'])}")
-        print(f"Retry Attempts: {retry_count}")
-        print(f"Status: {verification.get('status', 'unknown')}")
-        if len(step_results) > 0:
-            success_rate = (sum(1 for r in step_results if r['success']) / len(step_results)) * 100
-            print(f"Success Rate: {success_rate:.1f}%")
-        print(f"{'='*80}\n")
+        return self.send_to_llm(completion_prompt, final_screenshot)
     
-    def run_console_loop(self) -> None:
+    async def run_console_loop(self) -> None:
         print("\n" + "="*80)
         print(" CONTROL - Intelligent AI Assistant & Task Executor")
         print(" Full laptop access | Question answering | Task execution")
@@ -675,7 +927,7 @@ Respond ONLY with JSON:
                     print(f"Saved to {path}\n")
                     continue
                 
-                self.execute_task(user_input)
+                await self.execute_task(user_input)
             
             except KeyboardInterrupt:
                 print("\nExit!")
@@ -685,12 +937,16 @@ Respond ONLY with JSON:
                 logger.error(f"Error: {e}")
 
 def main():
+    backend = None
     try:
         backend = ConsoleTestBackend()
-        backend.run_console_loop()
+        asyncio.run(backend.run_console_loop())
     except Exception as e:
         print(f"[FATAL] {e}\n")
         sys.exit(1)
+    finally:
+        if backend is not None:
+            backend.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file